@@ -0,0 +1,244 @@
+"""Queries and bulk actions behind the admin applications panel"""
+import csv
+import io
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from pymongo import DESCENDING, UpdateMany
+
+import counters
+import events
+from dashboard_data import STATUSES, count_by_status, count_by_status_async
+from pagination import keyset_page, keyset_page_async
+
+
+PAGE_SIZE = 50
+BULK_BATCH_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+COUNT_LIMIT = 10000
+
+_SORT_FIELDS = ('applied_at', '_id')
+_LIST_PROJECTION = {'user_id': 1, 'job_id': 1, 'job_title': 1, 'company': 1,
+                    'applied_at': 1, 'status': 1}
+_USER_PROJECTION = {'full_name': 1, 'email': 1}
+_EXPORT_PROJECTION = dict(_LIST_PROJECTION, cover_letter=1)
+
+EXPORT_FIELDS = ('application_id', 'job_id', 'job_title', 'company', 'user_name', 'user_email',
+                 'status', 'applied_at', 'cover_letter')
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_id(value):
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return None
+
+
+def parse_filters(args):
+    """The panel's filter fields from query args or a form"""
+    return {name: args.get(name, '') for name in ('status', 'company', 'job_id', 'date_from', 'date_to')}
+
+
+def build_filter(status='', company='', job_id='', date_from='', date_to=''):
+    """Turn the panel's filter form into a MongoDB query
+
+    Dates are YYYY-MM-DD and both ends are inclusive; unparseable values are ignored.
+    """
+    query = {}
+    if status in STATUSES:
+        query['status'] = status
+    if company:
+        query['company'] = company
+    job_id = _parse_id(job_id)
+    if job_id:
+        query['job_id'] = job_id
+
+    applied_at = {}
+    start = _parse_date(date_from)
+    end = _parse_date(date_to)
+    if start:
+        applied_at['$gte'] = start
+    if end:
+        applied_at['$lt'] = end + timedelta(days=1)
+    if applied_at:
+        query['applied_at'] = applied_at
+    return query
+
+
+def _merge_users(applications, users):
+    for a in applications:
+        user = users.get(a['user_id'])
+        a['user_name'] = user['full_name'] if user else 'Unknown'
+        a['user_email'] = user['email'] if user else 'Unknown'
+    return applications
+
+
+def _users_query(applications):
+    return {'_id': {'$in': list({a['user_id'] for a in applications})}}
+
+
+def attach_users(users_col, applications):
+    """Set user_name/user_email on each application with one $in query"""
+    users = users_col.find(_users_query(applications), _USER_PROJECTION)
+    return _merge_users(applications, {u['_id']: u for u in users})
+
+
+async def attach_users_async(users_col, applications):
+    users = users_col.find(_users_query(applications), _USER_PROJECTION)
+    return _merge_users(applications, {u['_id']: u async for u in users})
+
+
+def application_page(applications_col, users_col, query, cursor=None, page_size=PAGE_SIZE):
+    """Return (applications with user details, next_cursor), most recent first"""
+    rows, next_cursor = keyset_page(applications_col, query, _LIST_PROJECTION,
+                                    _SORT_FIELDS, cursor=cursor, page_size=page_size)
+    return attach_users(users_col, rows), next_cursor
+
+
+async def application_page_async(applications_col, users_col, query, cursor=None,
+                                 page_size=PAGE_SIZE):
+    rows, next_cursor = await keyset_page_async(applications_col, query, _LIST_PROJECTION,
+                                                _SORT_FIELDS, cursor=cursor, page_size=page_size)
+    return await attach_users_async(users_col, rows), next_cursor
+
+
+def _capped(counts):
+    counts['capped'] = counts['total'] >= COUNT_LIMIT
+    return counts
+
+
+def status_counts(applications_col, counters_col, query):
+    """Per-status counts for the panel, without scanning every application
+
+    Unfiltered, they come from the global counters. Filtered counts stop at
+    COUNT_LIMIT matches and are then flagged as capped, meaning "at least".
+    """
+    if not query:
+        counts = counters.global_status_counts(counters_col)
+        if counts is not None:
+            counts['capped'] = False
+            return counts
+    return _capped(count_by_status(applications_col, query, limit=COUNT_LIMIT))
+
+
+async def status_counts_async(applications_col, counters_col, query):
+    if not query:
+        counts = await counters.global_status_counts_async(counters_col)
+        if counts is not None:
+            counts['capped'] = False
+            return counts
+    return _capped(await count_by_status_async(applications_col, query, limit=COUNT_LIMIT))
+
+
+def selection_query(application_ids):
+    """Query for the applications ticked in the panel; invalid ids are ignored"""
+    ids = [_parse_id(value) for value in application_ids]
+    return {'_id': {'$in': [i for i in ids if i is not None]}}
+
+
+def bulk_update_status(applications_col, counters_col, query, status, batch_size=BULK_BATCH_SIZE):
+    """Set `status` on every application matching `query`; returns how many changed
+
+    Works through the matches in _id order, one batch at a time: a batch is a
+    single bulk_write with one update_many per previous status, followed by
+    one $inc per affected user's counters. If another writer changes some of
+    the batch first, those users' counters are recounted instead.
+    """
+    updated = 0
+    last_id = None
+    while True:
+        clauses = [query, {'status': {'$ne': status}}]
+        if last_id is not None:
+            clauses.append({'_id': {'$gt': last_id}})
+        batch = list(applications_col.find({'$and': clauses}, {'user_id': 1, 'status': 1})
+                     .sort('_id', 1).limit(batch_size))
+        if not batch:
+            return updated
+        last_id = batch[-1]['_id']
+
+        by_status = defaultdict(list)
+        for application in batch:
+            by_status[application['status']].append(application['_id'])
+        changed_at = datetime.utcnow()
+        result = applications_col.bulk_write(
+            [UpdateMany({'_id': {'$in': ids}, 'status': old_status},
+                        {'$set': {'status': status, 'status_changed_at': changed_at}})
+             for old_status, ids in by_status.items()],
+            ordered=False)
+
+        if result.modified_count == len(batch):
+            counters.record_status_changes(counters_col, [(a['user_id'], a['status'], status)
+                                                          for a in batch])
+        else:
+            counters.recount_users(applications_col, counters_col, {a['user_id'] for a in batch})
+        updated += result.modified_count
+        events.publish(events.APPLICATIONS_CHANGED, applications=batch)
+
+
+def _export_row(application):
+    return {
+        'application_id': str(application['_id']),
+        'job_id': str(application['job_id']),
+        'job_title': application.get('job_title', ''),
+        'company': application.get('company', ''),
+        'user_name': application['user_name'],
+        'user_email': application['user_email'],
+        'status': application.get('status', ''),
+        'applied_at': application['applied_at'].isoformat() if application.get('applied_at') else '',
+        'cover_letter': application.get('cover_letter', ''),
+    }
+
+
+def export_batches(applications_col, users_col, query, batch_size=EXPORT_BATCH_SIZE):
+    """Yield lists of export rows for every matching application, most recent first
+
+    Applications are read from one server-side cursor `batch_size` at a time,
+    and each batch's users are loaded with a single $in query.
+    """
+    cursor = (applications_col.find(query, _EXPORT_PROJECTION)
+              .sort([('applied_at', DESCENDING), ('_id', DESCENDING)])
+              .batch_size(batch_size))
+    batch = []
+    for application in cursor:
+        batch.append(application)
+        if len(batch) == batch_size:
+            yield [_export_row(a) for a in attach_users(users_col, batch)]
+            batch = []
+    if batch:
+        yield [_export_row(a) for a in attach_users(users_col, batch)]
+
+
+def export_csv(batches):
+    """CSV text, header first, one chunk per batch"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    yield buffer.getvalue()
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+def export_ndjson(batches):
+    """One JSON object per line, one chunk per batch"""
+    for rows in batches:
+        yield ''.join(json.dumps(row) + '\n' for row in rows)
+
+
+# format -> (mimetype, writer)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', export_csv),
+    'ndjson': ('application/x-ndjson', export_ndjson),
+}
@@ -1,29 +1,181 @@
-from flask import Flask, render_template, request, session, redirect, url_for, flash, jsonify
-from pymongo import MongoClient
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, render_template, request, session, redirect, url_for, flash, jsonify, send_file
+from pymongo.errors import PyMongoError
+from werkzeug.middleware.proxy_fix import ProxyFix
 from functools import wraps
 from datetime import datetime
+import hmac
+import io
 import os
+import secrets
+import threading
+import click
+
+from indexes import ensure_indexes, index_report
+from dashboard_data import application_page, status_counts
+import admin_data
+import job_listing
+import facets
+import events
+import counters
+import database
+from page_cache import cached_page
+from normalize import GAZETTEER, normalize_job
+import ingest
+import user_cache
+import password_hashing
+import rate_limit
+import job_applications
+import instrumentation
+import recommend
+import migrations
+import live_updates
+import assets
+import image_cache
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
 
-
-MONGO_URI = "mongodb://localhost:27017/"
-try:
-    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-    client.admin.command('ping')
-    db = client['fitapply']
-    print("✓ MongoDB connected successfully")
-except Exception as e:
-    print(f"✗ MongoDB connection failed: {e}")
-    db = None
-
-
-users_col = db['users'] if db is not None else None
-jobs_col = db['jobs'] if db is not None else None
-applications_col = db['applications'] if db is not None else None
-
+# Reverse proxies in front of the app; their X-Forwarded-For/-Proto headers
+# are trusted so request.remote_addr, which rate limiting keys on, is the client
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+app.jinja_env.globals.update(asset_url=assets.asset_url, image_url=image_cache.image_url)
+
+
+users_col = database.collection('users')
+jobs_col = database.collection('jobs')
+applications_col = database.collection('applications')
+counters_col = database.collection('counters')
+
+_bootstrapped = False
+# environ key set by servers that already ran bootstrap() for this request
+BOOTSTRAP_TRIED = 'fitapply.bootstrap_tried'
+
+
+@app.before_request
+def start_request_metrics():
+    instrumentation.start_request()
+
+
+@app.after_request
+def finish_request_metrics(response):
+    return instrumentation.finish_request(response, request.endpoint, request.method)
+
+
+def is_bootstrapped():
+    return _bootstrapped
+
+
+def bootstrap():
+    """Create indexes and initial counters once per process; False if MongoDB failed"""
+    global _bootstrapped
+    if _bootstrapped:
+        return True
+    try:
+        db = database.get_db()
+        for col_name, index_name, error in ensure_indexes(db):
+            print(f"✗ Could not create index {col_name}.{index_name}: {error}")
+        if counters.global_counts(counters_col) is None:
+            counters.reconcile(db)
+    except PyMongoError as e:
+        print(f"✗ MongoDB bootstrap failed: {e}")
+        return False
+    _bootstrapped = True
+    threading.Thread(target=_backfill_legacy_jobs, name='backfill-jobs', daemon=True).start()
+    return True
+
+
+@app.before_request
+def bootstrap_database():
+    """Bootstrap on the first request; asgi.py does it before this hook, off the event loop"""
+    if _bootstrapped or request.endpoint == 'health' or request.environ.get(BOOTSTRAP_TRIED):
+        return
+    bootstrap()
+
+
+def _backfill_legacy_jobs():
+    """Give jobs stored before the salary fields existed their derived fields"""
+    try:
+        updated = migrations.backfill_legacy_jobs(jobs_col)
+    except PyMongoError as e:
+        print(f"✗ Job backfill failed, run backfill-jobs: {e}")
+        return
+    if updated:
+        print(f"✓ Backfilled derived fields on {updated} jobs")
+
+
+@app.cli.command('init-indexes')
+def init_indexes_command():
+    """Create the MongoDB indexes and report missing or unused ones"""
+    db = database.get_db()
+    for col_name, index_name, error in ensure_indexes(db):
+        click.echo(f"✗ {col_name}.{index_name}: {error}")
+
+    report = index_report(db)
+    for col_name, index_name in report['missing']:
+        click.echo(f"missing: {col_name}.{index_name}")
+    for col_name, index_name in report['unused']:
+        click.echo(f"unused:  {col_name}.{index_name}")
+    if not report['missing']:
+        click.echo("✓ All indexes present")
+
+
+@app.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """Recompute the precomputed counters from the source collections"""
+    fixed = counters.reconcile(database.get_db())
+    click.echo(f"✓ Counters reconciled ({fixed} documents corrected)")
+
+
+@app.cli.command('import-jobs')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'feed_format', type=click.Choice(sorted(ingest.READERS)),
+              help='Feed format; defaults to the file extension')
+@click.option('--batch-size', default=ingest.BATCH_SIZE, show_default=True)
+def import_jobs_command(path, feed_format, batch_size):
+    """Upsert jobs from an NDJSON or CSV feed file"""
+    feed_format = feed_format or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+
+    def echoed(reports):
+        for report in reports:
+            click.echo(f"batch {report['batch']}: {report['processed']} records, "
+                       f"{report['upserted']} new, {report['modified']} updated, "
+                       f"{report['rejected']} rejected, {report['records_per_second']} rec/s")
+            for reject in report['rejects']:
+                click.echo(f"  rejected {reject}")
+            yield report
+
+    with open(path, newline='', encoding='utf-8') as stream:
+        records = ingest.READERS[feed_format](stream)
+        summary = ingest.summarize(echoed(ingest.ingest(jobs_col, counters_col, records,
+                                                        batch_size=batch_size)))
+    click.echo(f"✓ Imported {summary['processed']} records in {summary['seconds']}s "
+               f"({summary['upserted']} new, {summary['modified']} updated, {summary['rejected']} rejected)")
+
+
+@app.cli.command('backfill-jobs')
+@click.option('--batch-size', default=migrations.BATCH_SIZE, show_default=True)
+def backfill_jobs_command(batch_size):
+    """Recompute salary_min/salary_max, remote and geo on existing jobs"""
+    scanned = updated = 0
+    for batch_scanned, batch_updated in migrations.backfill_job_fields(jobs_col, batch_size):
+        scanned += batch_scanned
+        updated += batch_updated
+        click.echo(f"{scanned} jobs scanned, {updated} updated")
+    if updated:
+        events.publish(events.JOBS_CHANGED, replaced=True)
+    click.echo(f"✓ Backfilled {updated} of {scanned} jobs")
+
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Minify, fingerprint and precompress the files under static/"""
+    manifest = assets.build()
+    for name, entry in sorted(manifest.items()):
+        encodings = f" (+{', '.join(entry['encodings'])})" if entry['encodings'] else ''
+        click.echo(f"{name} -> {entry['file']}{encodings}")
+    click.echo(f"✓ Built {len(manifest)} assets into {assets.BUILD_DIR}")
 
 
 def login_required(f):
@@ -37,30 +189,77 @@ def login_required(f):
     return decorated_function
 
 
+def _bearer_token():
+    auth = request.headers.get('Authorization', '')
+    return auth[len('Bearer '):] if auth.startswith('Bearer ') else ''
+
+
+def _token_matches(supplied, token):
+    return hmac.compare_digest(supplied.encode(), token.encode())
+
+
+def admin_required(f):
+    """Decorator for admin actions: an admin session or 'Authorization: Bearer <ADMIN_API_TOKEN>'"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = os.environ.get('ADMIN_API_TOKEN')
+        if not token:
+            return jsonify({'error': 'Admin actions are disabled'}), 403
+        if not session.get('admin') and not _token_matches(_bearer_token(), token):
+            flash('Please sign in as admin first', 'danger')
+            return redirect(url_for('admin_login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def csrf_token():
+    """Per-session token that state-changing admin forms must send back"""
+    if 'csrf_token' not in session:
+        session['csrf_token'] = secrets.token_urlsafe(32)
+    return session['csrf_token']
+
+
+def valid_csrf_token():
+    expected = session.get('csrf_token')
+    if not expected:
+        return False
+    return _token_matches(request.form.get('csrf_token', ''), expected)
+
+
+app.jinja_env.globals.update(csrf_token=csrf_token)
+
+
 def get_current_user():
     """Get current logged-in user"""
-    if 'user_id' not in session:
-        return None
-    from bson.objectid import ObjectId
-    return users_col.find_one({'_id': ObjectId(session['user_id'])})
+    user = user_cache.current_user(users_col)
+    if user is not None and session.get('user_name') != user.full_name:
+        session['user_name'] = user.full_name
+    return user
 
 
 
 @app.route('/')
+@cached_page(tags=('jobs', 'users'))
 def index():
     """Home page"""
-    total_jobs = jobs_col.count_documents({}) if jobs_col is not None else 0
-    total_users = users_col.count_documents({}) if users_col is not None else 0
-    return render_template('index.html', total_jobs=total_jobs, total_users=total_users)
+    totals = counters.global_counts(counters_col)
+    if totals is None:
+        totals = {
+            'jobs': jobs_col.count_documents({}),
+            'users': users_col.count_documents({}),
+        }
+    return render_template('index.html', total_jobs=totals['jobs'], total_users=totals['users'])
 
 
 @app.route('/about')
+@cached_page()
 def about():
     """About page"""
     return render_template('about.html')
 
 
 @app.route('/help')
+@cached_page()
 def help():
     """Help/FAQ page"""
     return render_template('help.html')
@@ -90,16 +289,25 @@ def signup():
             flash('Password must be at least 6 characters', 'danger')
             return redirect(url_for('signup'))
 
+        if not rate_limit.allow_auth_attempt(request.remote_addr, email):
+            flash('Too many attempts, please try again in a minute', 'danger')
+            return render_template('signup.html'), 429
+
         
         if users_col.find_one({'email': email}):
             flash('Email already registered', 'danger')
             return redirect(url_for('signup'))
 
-        
+        try:
+            password_hash = password_hashing.hash_password(password)
+        except password_hashing.HashingBusy:
+            flash('The server is busy, please try again in a moment', 'danger')
+            return render_template('signup.html'), 503
+
         user_data = {
             'full_name': full_name,
             'email': email,
-            'password': generate_password_hash(password),
+            'password': password_hash,
             'phone': phone,
             'location': location,
             'created_at': datetime.utcnow(),
@@ -108,6 +316,8 @@ def signup():
         }
 
         result = users_col.insert_one(user_data)
+        counters.record_signup(counters_col)
+        events.publish(events.USERS_CHANGED)
         flash('Account created successfully! Please login', 'success')
         return redirect(url_for('login'))
 
@@ -121,9 +331,25 @@ def login():
         email = request.form.get('email')
         password = request.form.get('password')
 
+        if not rate_limit.allow_auth_attempt(request.remote_addr, email):
+            flash('Too many login attempts, please try again in a minute', 'danger')
+            return render_template('login.html'), 429
+
         user = users_col.find_one({'email': email})
 
-        if user and check_password_hash(user['password'], password):
+        try:
+            valid = user is not None and password_hashing.verify_password(user['password'], password)
+        except password_hashing.HashingBusy:
+            flash('The server is busy, please try again in a moment', 'danger')
+            return render_template('login.html'), 503
+
+        if valid:
+            if password_hashing.needs_rehash(user['password']):
+                try:
+                    users_col.update_one({'_id': user['_id']},
+                                         {'$set': {'password': password_hashing.hash_password(password)}})
+                except password_hashing.HashingBusy:
+                    pass  # keep the old hash; the next login will upgrade it
             session['user_id'] = str(user['_id'])
             session['user_name'] = user['full_name']
             session['user_email'] = user['email']
@@ -145,24 +371,23 @@ def logout():
 
 
 @app.route('/jobs')
+@cached_page(tags=('jobs',))
 def jobs():
     """List all jobs"""
-    category = request.args.get('category', '')
+    filters = job_listing.parse_filters(request.args)
     search = request.args.get('search', '')
+    sort = job_listing.resolve_sort(request.args.get('sort', ''), search)
 
-    query = {}
-    if category:
-        query['category'] = category
-    if search:
-        query['$text'] = {'$search': search}
+    jobs_list, next_cursor = job_listing.job_page(jobs_col, filters, search=search, sort=sort,
+                                                  cursor=request.args.get('cursor'))
 
-    jobs_list = list(jobs_col.find(query).limit(50)) if jobs_col is not None else []
-    categories = jobs_col.distinct('category') if jobs_col is not None else []
-
-    return render_template('jobs.html', jobs=jobs_list, categories=categories, search=search)
+    return render_template('jobs.html', jobs=jobs_list, facets=facets.get_facets(jobs_col),
+                           search=search, filters=filters, sort=sort, next_cursor=next_cursor,
+                           places=GAZETTEER)
 
 
 @app.route('/job/<job_id>')
+@cached_page(tags=('jobs', 'applications'))
 def job_detail(job_id):
     """Job detail page"""
     from bson.objectid import ObjectId
@@ -176,11 +401,13 @@ def job_detail(job_id):
     user_applied = False
     if 'user_id' in session:
         user_applied = applications_col.find_one({
-            'user_id': ObjectId(session['user_id']),
-            'job_id': ObjectId(job_id)
+            'user_id': user_cache.current_user_id(),
+            'job_id': job['_id']
         }) is not None
 
-    return render_template('job_detail.html', job=job, user_applied=user_applied)
+    applicants = counters.job_applicant_count(counters_col, job['_id'])
+    return render_template('job_detail.html', job=job, user_applied=user_applied,
+                           applicants=applicants)
 
 
 @app.route('/job/<job_id>/apply', methods=['POST'])
@@ -189,54 +416,52 @@ def apply_job(job_id):
     """Apply for a job"""
     from bson.objectid import ObjectId
 
-    job_id_obj = ObjectId(job_id)
-    user_id_obj = ObjectId(session['user_id'])
-    job = jobs_col.find_one({'_id': job_id_obj})
+    result = job_applications.apply(applications_col, jobs_col, counters_col,
+                                    user_cache.current_user_id(), ObjectId(job_id),
+                                    request.form.get('cover_letter', ''))
 
-    if not job:
+    if result == job_applications.JOB_NOT_FOUND:
         return jsonify({'error': 'Job not found'}), 404
-
-   
-    if applications_col.find_one({'user_id': user_id_obj, 'job_id': job_id_obj}):
-        return jsonify({'error': 'Already applied'}), 400
-
-    application = {
-        'user_id': user_id_obj,
-        'job_id': job_id_obj,
-        'job_title': job['title'],
-        'company': job['company'],
-        'cover_letter': request.form.get('cover_letter', ''),
-        'applied_at': datetime.utcnow(),
-        'status': 'pending'
-    }
-
-    applications_col.insert_one(application)
-    flash('Application submitted successfully!', 'success')
+    if result == job_applications.ALREADY_APPLIED:
+        flash('You have already applied for this job.', 'info')
+    else:
+        flash('Application submitted successfully!', 'success')
     return redirect(url_for('job_detail', job_id=job_id))
 
 
-
 @app.route('/dashboard')
 @login_required
 def dashboard():
     """User dashboard"""
-    from bson.objectid import ObjectId
-
-    user_id_obj = ObjectId(session['user_id'])
-    applications = list(applications_col.find({'user_id': user_id_obj}))
-
-
-    total_applications = len(applications)
-    pending_count = applications_col.count_documents({'user_id': user_id_obj, 'status': 'pending'})
-    accepted_count = applications_col.count_documents({'user_id': user_id_obj, 'status': 'accepted'})
-    rejected_count = applications_col.count_documents({'user_id': user_id_obj, 'status': 'rejected'})
+    user_id_obj = user_cache.current_user_id()
+    applications, next_cursor = application_page(applications_col, user_id_obj,
+                                                 cursor=request.args.get('cursor'))
+    counts = counters.user_status_counts(counters_col, user_id_obj)
+    if counts is None:
+        counts = status_counts(applications_col, user_id_obj)
+
+    recommendations = None
+    user = get_current_user()
+    if user is not None and not request.args.get('cursor'):
+        recommendations = recommend.recommendations(jobs_col, applications_col, user)
 
     return render_template('dashboard.html',
                          applications=applications,
-                         total_applications=total_applications,
-                         pending_count=pending_count,
-                         accepted_count=accepted_count,
-                         rejected_count=rejected_count)
+                         recommendations=recommendations,
+                         next_cursor=next_cursor,
+                         total_applications=counts['total'],
+                         pending_count=counts['pending'],
+                         accepted_count=counts['accepted'],
+                         rejected_count=counts['rejected'])
+
+
+@app.route('/dashboard/stream')
+@login_required
+def dashboard_stream():
+    """Server-sent events with the user's application status changes"""
+    return app.response_class(live_updates.stream(user_cache.current_user_id()),
+                              mimetype='text/event-stream',
+                              headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route('/profile')
@@ -251,9 +476,7 @@ def profile():
 @login_required
 def update_profile():
     """Update user profile"""
-    from bson.objectid import ObjectId
-
-    user_id_obj = ObjectId(session['user_id'])
+    user_id_obj = user_cache.current_user_id()
     update_data = {
         'full_name': request.form.get('full_name'),
         'phone': request.form.get('phone'),
@@ -262,6 +485,7 @@ def update_profile():
     }
 
     users_col.update_one({'_id': user_id_obj}, {'$set': update_data})
+    user_cache.invalidate(user_id_obj)
     session['user_name'] = update_data['full_name']
 
     flash('Profile updated successfully', 'success')
@@ -475,8 +699,13 @@ def seed_jobs():
         ]
 
        
-        jobs_col.delete_many({})
+        for job in sample_jobs:
+            normalize_job(job)
+
+        deleted = jobs_col.delete_many({}).deleted_count
         jobs_col.insert_many(sample_jobs)
+        counters.record_jobs_added(counters_col, len(sample_jobs) - deleted)
+        events.publish(events.JOBS_CHANGED, jobs=sample_jobs, replaced=True)
 
         flash(f'Successfully seeded {len(sample_jobs)} jobs!', 'success')
         return redirect(url_for('jobs'))
@@ -484,26 +713,67 @@ def seed_jobs():
     return render_template('seed_jobs.html')
 
 
+@app.route('/admin/jobs/import', methods=['POST'])
+def import_jobs():
+    """Bulk job feed ingestion; needs 'Authorization: Bearer <INGEST_API_TOKEN>'"""
+    token = os.environ.get('INGEST_API_TOKEN')
+    if not token:
+        return jsonify({'error': 'Job import is disabled'}), 403
+    if not _token_matches(_bearer_token(), token):
+        return jsonify({'error': 'Invalid token'}), 401
+
+    feed_format = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+    if feed_format not in ingest.READERS:
+        return jsonify({'error': f'Unsupported format {feed_format}'}), 400
+
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    records = ingest.READERS[feed_format](stream)
+    return jsonify(ingest.summarize(ingest.ingest(jobs_col, counters_col, records)))
+
+
+@app.route('/admin/login', methods=['GET', 'POST'])
+def admin_login():
+    """Start an admin session with ADMIN_API_TOKEN, for the bulk actions and exports"""
+    token = os.environ.get('ADMIN_API_TOKEN')
+    if not token:
+        return jsonify({'error': 'Admin actions are disabled'}), 403
+    if request.method == 'POST':
+        if _token_matches(request.form.get('token', ''), token):
+            session['admin'] = True
+            flash('Signed in as admin', 'success')
+            return redirect(url_for('admin_applications'))
+        flash('Invalid admin token', 'danger')
+    return render_template('admin_login.html')
+
+
 @app.route('/admin/applications')
+@admin_required
 def admin_applications():
     """Admin panel to view and manage applications"""
-    
-    applications = list(applications_col.find())
-    
-   
-    for app in applications:
-        user = users_col.find_one({'_id': app['user_id']})
-        app['user_name'] = user['full_name'] if user else 'Unknown'
-        app['user_email'] = user['email'] if user else 'Unknown'
-    
-    return render_template('admin_applications.html', applications=applications)
+    filters = admin_data.parse_filters(request.args)
+    query = admin_data.build_filter(**filters)
+
+    applications, next_cursor = admin_data.application_page(applications_col, users_col, query,
+                                                            cursor=request.args.get('cursor'))
+    counts = admin_data.status_counts(applications_col, counters_col, query)
+
+    return render_template('admin_applications.html',
+                         applications=applications,
+                         next_cursor=next_cursor,
+                         filters=filters,
+                         counts=counts)
 
 
 @app.route('/admin/application/<app_id>/update-status', methods=['POST'])
+@admin_required
 def update_application_status(app_id):
     """Update application status"""
     from bson.objectid import ObjectId
     
+    if not valid_csrf_token():
+        flash('The form has expired, please try again', 'danger')
+        return redirect(url_for('admin_applications'))
+
     status = request.form.get('status')
     app_id_obj = ObjectId(app_id)
     
@@ -511,11 +781,109 @@ def update_application_status(app_id):
         flash('Invalid status', 'danger')
         return redirect(url_for('admin_applications'))
     
-    applications_col.update_one({'_id': app_id_obj}, {'$set': {'status': status}})
+    previous = applications_col.find_one_and_update({'_id': app_id_obj},
+                                                    {'$set': {'status': status,
+                                                              'status_changed_at': datetime.utcnow()}},
+                                                    projection={'user_id': 1, 'status': 1})
+    if previous:
+        counters.record_status_change(counters_col, previous['user_id'], previous['status'], status)
+    events.publish(events.APPLICATIONS_CHANGED)
     flash(f'Application status updated to {status}', 'success')
     return redirect(url_for('admin_applications'))
 
 
+@app.route('/admin/applications/bulk-status', methods=['POST'])
+@admin_required
+def bulk_update_status():
+    """Set one status on the ticked applications, or on every application matching the filters"""
+    status = request.form.get('new_status')
+    filters = admin_data.parse_filters(request.form)
+
+    if not valid_csrf_token():
+        flash('The form has expired, please try again', 'danger')
+        return redirect(url_for('admin_applications', **filters))
+
+    if status not in ['pending', 'accepted', 'rejected']:
+        flash('Invalid status', 'danger')
+        return redirect(url_for('admin_applications', **filters))
+
+    if request.form.get('scope') == 'filter':
+        query = admin_data.build_filter(**filters)
+    else:
+        query = admin_data.selection_query(request.form.getlist('application_ids'))
+        if not query['_id']['$in']:
+            flash('No applications selected', 'danger')
+            return redirect(url_for('admin_applications', **filters))
+
+    updated = admin_data.bulk_update_status(applications_col, counters_col, query, status)
+    flash(f'{updated} applications updated to {status}', 'success')
+    return redirect(url_for('admin_applications', **filters))
+
+
+@app.route('/admin/applications/export')
+@admin_required
+def export_applications():
+    """Stream the filtered applications with applicant details as CSV or NDJSON"""
+    feed_format = request.args.get('format', 'csv')
+    if feed_format not in admin_data.EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported format {feed_format}'}), 400
+
+    mimetype, writer = admin_data.EXPORT_FORMATS[feed_format]
+    query = admin_data.build_filter(**admin_data.parse_filters(request.args))
+    batches = admin_data.export_batches(applications_col, users_col, query)
+    filename = f"applications-{datetime.utcnow():%Y%m%d}.{feed_format}"
+    return app.response_class(writer(batches), mimetype=mimetype,
+                              headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+
+@app.route('/assets/<path:filename>')
+def hashed_asset(filename):
+    """Fingerprinted static files from `flask build-assets`, cacheable forever"""
+    return assets.send_asset(filename)
+
+
+@app.route('/images')
+def proxied_image():
+    """Local copy of an allow-listed remote image, resized to `w` when Pillow is installed"""
+    url = request.args.get('url', '')
+    width = request.args.get('w', type=int)
+    if not image_cache.is_proxied(url):
+        return jsonify({'error': 'Image host not allowed'}), 400
+    if not image_cache.valid_signature(url, width, request.args.get('sig', '')):
+        return jsonify({'error': 'Invalid image signature'}), 403
+    try:
+        path, mimetype = image_cache.fetch(url, width)
+    except image_cache.ImageUnavailable as e:
+        print(f"✗ Image proxy: {e}")
+        return redirect(url)
+    return send_file(path, mimetype=mimetype, max_age=image_cache.IMAGE_CACHE_MAX_AGE)
+
+
+@app.route('/health')
+def health():
+    """Readiness probe with MongoDB latency and connection pool statistics"""
+    status = {
+        'status': 'ok',
+        'pool': database.pool_stats.snapshot(),
+        'password_hashing': password_hashing.stats.snapshot(),
+    }
+    try:
+        status['mongo_ping_ms'] = round(database.ping(), 2)
+    except PyMongoError as e:
+        status['status'] = 'unavailable'
+        status['error'] = str(e)
+        return jsonify(status), 503
+    return jsonify(status)
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics for this worker process"""
+    body = instrumentation.render_metrics(database.pool_stats.snapshot(),
+                                          password_hashing.stats.snapshot())
+    return app.response_class(body, mimetype='text/plain; version=0.0.4')
+
 
 @app.errorhandler(404)
 def not_found(error):
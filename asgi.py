@@ -0,0 +1,308 @@
+"""ASGI entry point with async versions of the busiest routes
+
+    pip install -r requirements-async.txt
+    uvicorn asgi:application --workers 4
+
+jobs, job_detail, dashboard, apply_job and admin_applications run here as
+coroutines on motor, with independent queries awaited together, and
+/dashboard/stream pushes status changes without a thread per client. They run
+inside the Flask app's own request context, so sessions, flash messages,
+url_for, templates and page caching behave exactly as under WSGI. Every
+other route is handed to the Flask app unchanged through asgiref.
+"""
+import asyncio
+import io
+import sys
+
+from asgiref.wsgi import WsgiToAsgi
+from bson.objectid import ObjectId
+from flask import flash, jsonify, redirect, render_template, request, session, url_for
+from werkzeug.exceptions import HTTPException
+
+import admin_data
+import counters
+import dashboard_data
+import database
+import facets
+import job_applications
+import job_listing
+import live_updates
+import normalize
+import recommend
+import user_cache
+from app import (BOOTSTRAP_TRIED, admin_required, app, bootstrap, get_current_user,
+                 is_bootstrapped, jobs_col, login_required)
+from page_cache import cached_page
+
+
+def _collections():
+    db = database.get_async_db()
+    return db['users'], db['jobs'], db['applications'], db['counters']
+
+
+@cached_page(tags=('jobs',))
+async def jobs():
+    """List all jobs"""
+    _, async_jobs_col, _, _ = _collections()
+    filters = job_listing.parse_filters(request.args)
+    search = request.args.get('search', '')
+    sort = job_listing.resolve_sort(request.args.get('sort', ''), search)
+
+    # facets are cached for minutes at a time, so they stay on the sync client
+    (jobs_list, next_cursor), facet_counts = await asyncio.gather(
+        job_listing.job_page_async(jobs_col, async_jobs_col, filters, search=search, sort=sort,
+                                   cursor=request.args.get('cursor')),
+        asyncio.to_thread(facets.get_facets, jobs_col),
+    )
+
+    return render_template('jobs.html', jobs=jobs_list, facets=facet_counts,
+                           search=search, filters=filters, sort=sort, next_cursor=next_cursor,
+                           places=normalize.GAZETTEER)
+
+
+async def _user_applied(applications_col, job_id):
+    if 'user_id' not in session:
+        return False
+    found = await applications_col.find_one({'user_id': user_cache.current_user_id(),
+                                             'job_id': job_id}, {'_id': 1})
+    return found is not None
+
+
+@cached_page(tags=('jobs', 'applications'))
+async def job_detail(job_id):
+    """Job detail page"""
+    _, async_jobs_col, applications_col, counters_col = _collections()
+    job_id_obj = ObjectId(job_id)
+    job, user_applied, applicants = await asyncio.gather(
+        async_jobs_col.find_one({'_id': job_id_obj}),
+        _user_applied(applications_col, job_id_obj),
+        counters.job_applicant_count_async(counters_col, job_id_obj),
+    )
+
+    if not job:
+        flash('Job not found', 'danger')
+        return redirect(url_for('jobs'))
+
+    return render_template('job_detail.html', job=job, user_applied=user_applied,
+                           applicants=applicants)
+
+
+@login_required
+async def apply_job(job_id):
+    """Apply for a job"""
+    _, async_jobs_col, applications_col, counters_col = _collections()
+    result = await job_applications.apply_async(applications_col, async_jobs_col, counters_col,
+                                                user_cache.current_user_id(), ObjectId(job_id),
+                                                request.form.get('cover_letter', ''))
+
+    if result == job_applications.JOB_NOT_FOUND:
+        return jsonify({'error': 'Job not found'}), 404
+    if result == job_applications.ALREADY_APPLIED:
+        flash('You have already applied for this job.', 'info')
+    else:
+        flash('Application submitted successfully!', 'success')
+    return redirect(url_for('job_detail', job_id=job_id))
+
+
+async def _recommendations():
+    # the skill matrix is process-local and mostly cached, so this stays on
+    # the sync client in a worker thread
+    if request.args.get('cursor'):
+        return None
+    user = await asyncio.to_thread(get_current_user)
+    if user is None:
+        return None
+    return await asyncio.to_thread(recommend.recommendations, jobs_col,
+                                   database.collection('applications'), user)
+
+
+@login_required
+async def dashboard():
+    """User dashboard"""
+    _, _, applications_col, counters_col = _collections()
+    user_id_obj = user_cache.current_user_id()
+    (applications, next_cursor), counts, recommendations = await asyncio.gather(
+        dashboard_data.application_page_async(applications_col, user_id_obj,
+                                              cursor=request.args.get('cursor')),
+        counters.user_status_counts_async(counters_col, user_id_obj),
+        _recommendations(),
+    )
+    if counts is None:
+        counts = await dashboard_data.status_counts_async(applications_col, user_id_obj)
+
+    return render_template('dashboard.html',
+                           applications=applications,
+                           recommendations=recommendations,
+                           next_cursor=next_cursor,
+                           total_applications=counts['total'],
+                           pending_count=counts['pending'],
+                           accepted_count=counts['accepted'],
+                           rejected_count=counts['rejected'])
+
+
+@login_required
+async def dashboard_stream():
+    """Server-sent events with the user's application status changes"""
+    response = app.response_class(mimetype='text/event-stream',
+                                  headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # sent by _send as it is produced, instead of the (empty) body
+    response.async_body = live_updates.stream_async(user_cache.current_user_id())
+    return response
+
+
+@admin_required
+async def admin_applications():
+    """Admin panel to view and manage applications"""
+    users_col, _, applications_col, counters_col = _collections()
+    filters = admin_data.parse_filters(request.args)
+    query = admin_data.build_filter(**filters)
+
+    (applications, next_cursor), counts = await asyncio.gather(
+        admin_data.application_page_async(applications_col, users_col, query,
+                                          cursor=request.args.get('cursor')),
+        admin_data.status_counts_async(applications_col, counters_col, query),
+    )
+
+    return render_template('admin_applications.html',
+                           applications=applications,
+                           next_cursor=next_cursor,
+                           filters=filters,
+                           counts=counts)
+
+
+# endpoint name (as registered on the Flask app) -> coroutine view
+ASYNC_VIEWS = {view.__name__: view for view in
+               (jobs, job_detail, apply_job, dashboard, dashboard_stream, admin_applications)}
+
+
+def _environ(scope, body):
+    """Build the WSGI environ Flask expects from an ASGI HTTP scope"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1')
+        if name in ('content-length', 'content-type'):
+            key = name.upper().replace('-', '_')
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        value = value.decode('latin1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def _async_view_for(scope):
+    """The coroutine view serving this request, or None to hand it to Flask"""
+    adapter = app.url_map.bind_to_environ(_environ(scope, b''))
+    try:
+        endpoint, _ = adapter.match()
+    except HTTPException:
+        return None
+    return ASYNC_VIEWS.get(endpoint)
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def _dispatch(view, environ):
+    """Mirror Flask.wsgi_app for a coroutine view; returns the finished response
+
+    The first-request bootstrap (index builds, counter reconciliation) runs
+    in a worker thread here, so the before_request hook skips it.
+    """
+    if not is_bootstrapped():
+        await asyncio.to_thread(bootstrap)
+    environ[BOOTSTRAP_TRIED] = True
+    ctx = app.request_context(environ)
+    error = None
+    try:
+        ctx.push()
+        try:
+            rv = app.preprocess_request()
+            if rv is None:
+                if request.routing_exception is not None:
+                    app.raise_routing_exception(request)
+                rv = view(**request.view_args)
+                if asyncio.iscoroutine(rv):
+                    rv = await rv
+        except Exception as e:
+            rv = app.handle_user_exception(e)
+        return app.finalize_request(rv)
+    except Exception as e:
+        error = e
+        return app.handle_exception(e)
+    finally:
+        ctx.pop(error)
+
+
+async def _stream(send, receive, chunks):
+    """Send an async iterator of str chunks until it ends or the client disconnects"""
+    async def pump():
+        async for chunk in chunks:
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def disconnected():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(disconnected())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await chunks.aclose()
+
+
+async def _send(send, receive, response, environ):
+    app_iter, status, headers = response.get_wsgi_response(environ)
+    chunks = getattr(response, 'async_body', None)
+    if chunks is not None:
+        headers = [(k, v) for k, v in headers if k.lower() != 'content-length']
+    await send({
+        'type': 'http.response.start',
+        'status': int(status.split(' ', 1)[0]),
+        'headers': [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in headers],
+    })
+    if chunks is not None and response.status_code == 200:
+        await _stream(send, receive, chunks)
+    else:
+        await send({'type': 'http.response.body', 'body': b''.join(app_iter)})
+
+
+_wsgi_fallback = WsgiToAsgi(app)
+
+
+async def application(scope, receive, send):
+    view = _async_view_for(scope) if scope['type'] == 'http' else None
+    if view is None:
+        await _wsgi_fallback(scope, receive, send)
+        return
+
+    environ = _environ(scope, await _read_body(receive))
+    response = await _dispatch(view, environ)
+    await _send(send, receive, response, environ)
@@ -0,0 +1,166 @@
+"""Fingerprinted, precompressed static files
+
+`flask --app app build-assets` minifies the CSS under static/, writes every
+file to static/build/ under a name containing a hash of its content, plus
+.gz and (with the brotli package) .br copies of text files, and records
+them in static/build/manifest.json. Templates link files with
+asset_url('style.css'), which points at the fingerprinted copy; since its
+name changes whenever its content does, /assets/ serves it as immutable for
+a year. Without a manifest asset_url falls back to the plain static URL,
+so development works without a build step.
+
+Old fingerprinted files are kept, so pages cached before a rebuild still
+load. The manifest is read once per process: build before (re)starting.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import threading
+
+from flask import abort, request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+BUILD_DIR = os.path.join(STATIC_DIR, 'build')
+MANIFEST = os.path.join(BUILD_DIR, 'manifest.json')
+
+MAX_AGE = 365 * 24 * 3600
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html')
+
+# preferred first
+_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.DOTALL)
+_CSS_SPACE = re.compile(r'\s+')
+_CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+_CSS_COLON = re.compile(r':\s+')
+
+
+def minify_css(text):
+    """Drop comments and insignificant whitespace; leaves selectors and values intact"""
+    text = _CSS_COMMENT.sub('', text)
+    text = _CSS_SPACE.sub(' ', text)
+    text = _CSS_PUNCTUATION.sub(r'\1', text)
+    text = _CSS_COLON.sub(':', text)
+    return text.replace(';}', '}').strip()
+
+
+MINIFIERS = {'.css': minify_css}
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def _fingerprinted(name, data):
+    root, ext = os.path.splitext(name)
+    return f'{root}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def build(static_dir=STATIC_DIR, build_dir=BUILD_DIR):
+    """Build every file under static_dir into build_dir; returns the manifest
+
+    The manifest maps each source path to its fingerprinted name and the
+    precompressed encodings written next to it.
+    """
+    brotli = _brotli()
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != build_dir]
+        for filename in sorted(files):
+            source = os.path.join(root, filename)
+            name = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            ext = os.path.splitext(name)[1].lower()
+            with open(source, 'rb') as f:
+                data = f.read()
+            if ext in MINIFIERS:
+                data = MINIFIERS[ext](data.decode('utf-8')).encode('utf-8')
+
+            target = _fingerprinted(name, data)
+            path = os.path.join(build_dir, target)
+            _write(path, data)
+            encodings = []
+            if ext in COMPRESSIBLE:
+                if brotli is not None:
+                    _write(path + '.br', brotli.compress(data, quality=11))
+                    encodings.append('br')
+                _write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+                encodings.append('gzip')
+            manifest[name] = {'file': target, 'encodings': encodings}
+
+    _write(os.path.join(build_dir, 'manifest.json'),
+           json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+_manifest = None
+_lock = threading.Lock()
+
+
+def _load():
+    global _manifest
+    if _manifest is None:
+        with _lock:
+            if _manifest is None:
+                try:
+                    with open(MANIFEST) as f:
+                        _manifest = json.load(f)
+                except (OSError, ValueError):
+                    _manifest = {}
+    return _manifest
+
+
+def reload():
+    """Forget the loaded manifest; the next asset_url reads it again"""
+    global _manifest
+    with _lock:
+        _manifest = None
+
+
+def asset_url(filename):
+    """URL of the fingerprinted build of a static file, or its plain static URL"""
+    entry = _load().get(filename)
+    if entry is None:
+        return url_for('static', filename=filename)
+    return url_for('hashed_asset', filename=entry['file'])
+
+
+def send_asset(filename):
+    """Response for a fingerprinted file, precompressed when the client accepts it"""
+    path = safe_join(BUILD_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    response = None
+    compressed = False
+    for encoding, suffix in _ENCODINGS:
+        if not os.path.isfile(path + suffix):
+            continue
+        compressed = True
+        if response is None and encoding in request.accept_encodings:
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = send_from_directory(BUILD_DIR, filename + suffix, mimetype=mimetype,
+                                           max_age=MAX_AGE)
+            response.headers['Content-Encoding'] = encoding
+    if response is None:
+        response = send_from_directory(BUILD_DIR, filename, max_age=MAX_AGE)
+
+    if compressed:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
@@ -0,0 +1 @@
+"""Load and latency benchmarks for the Flask app; see bench/run.py"""
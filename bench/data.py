@@ -0,0 +1,128 @@
+"""Deterministic synthetic jobs, users and applications for benchmarking"""
+import random
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+import counters
+import password_hashing
+from indexes import ensure_indexes
+from normalize import normalize_job
+
+
+PASSWORD = 'bench-password'
+_BATCH = 5000
+
+LEVELS = ('Junior', 'Mid-level', 'Senior', 'Staff', 'Lead', 'Principal')
+ROLES = {
+    'Backend': ('Python Developer', 'Go Engineer', 'Java Developer', 'API Developer', 'Backend Architect'),
+    'Frontend': ('React Developer', 'Vue.js Engineer', 'Frontend Engineer', 'UI Developer'),
+    'Full Stack': ('Full Stack Developer', 'Node.js Engineer', 'Web Developer'),
+    'DevOps': ('DevOps Engineer', 'Site Reliability Engineer', 'Platform Engineer', 'Cloud Engineer'),
+    'Data Science': ('Data Scientist', 'ML Engineer', 'Data Engineer', 'Analytics Engineer'),
+    'Mobile': ('iOS Developer', 'Android Developer', 'Flutter Developer'),
+    'Design': ('Product Designer', 'UX Researcher', 'UI Designer'),
+    'QA': ('QA Engineer', 'Test Automation Engineer', 'SDET'),
+}
+SKILLS = {
+    'Backend': ('Python', 'Django', 'FastAPI', 'Go', 'Java', 'Spring', 'PostgreSQL', 'MongoDB', 'Redis', 'Kafka'),
+    'Frontend': ('React', 'TypeScript', 'Vue.js', 'Next.js', 'CSS', 'Webpack', 'Testing Library'),
+    'Full Stack': ('Node.js', 'React', 'MongoDB', 'Express', 'GraphQL', 'Docker', 'AWS'),
+    'DevOps': ('Kubernetes', 'Docker', 'Terraform', 'AWS', 'GCP', 'Prometheus', 'Jenkins', 'Ansible'),
+    'Data Science': ('Python', 'Pandas', 'PyTorch', 'TensorFlow', 'SQL', 'Spark', 'Statistics'),
+    'Mobile': ('Swift', 'SwiftUI', 'Kotlin', 'Jetpack Compose', 'Flutter', 'Dart', 'Firebase'),
+    'Design': ('Figma', 'Prototyping', 'User Research', 'Design Systems', 'Accessibility'),
+    'QA': ('Selenium', 'Cypress', 'Pytest', 'Playwright', 'CI/CD', 'Load Testing'),
+}
+COMPANIES = ('TechCorp Solutions', 'WebFlow Studios', 'CloudBase Inc', 'InfraCloud Systems',
+             'Analytics Pro', 'AppWorks', 'DesignHub', 'QualityFirst', 'DataForge', 'ByteScale',
+             'Northwind Labs', 'Bluepeak Software', 'Helix Health', 'Orbital Logistics', 'Finch Finance')
+LOCATIONS = ('Remote', 'Remote', 'New York, NY', 'San Francisco, CA', 'Seattle, WA', 'Austin, TX',
+             'Boston, MA', 'Chicago, IL', 'Denver, CO', 'Los Angeles, CA', 'Atlanta, GA')
+STATUS_WEIGHTS = (('pending', 70), ('accepted', 10), ('rejected', 20))
+SEARCH_TERMS = ('python', 'react', 'kubernetes', 'data', 'senior', 'remote', 'pyhton',
+                'engineer', 'design', 'mobile', 'go', 'aws docker')
+
+
+def make_job(rng, i, now):
+    category = rng.choice(tuple(ROLES))
+    low = rng.randrange(60, 180) * 1000
+    return normalize_job({
+        'external_key': f'bench-job-{i}',
+        'title': f'{rng.choice(LEVELS)} {rng.choice(ROLES[category])}',
+        'company': rng.choice(COMPANIES),
+        'category': category,
+        'location': rng.choice(LOCATIONS),
+        'salary': f'${low:,} - ${low + rng.randrange(10, 60) * 1000:,}',
+        'description': f'Help us build {category.lower()} products at scale. '
+                       f'Job {i} of the benchmark data set.',
+        'requirements': rng.sample(SKILLS[category], 4),
+        'posted_at': now - timedelta(minutes=rng.randrange(180 * 24 * 60)),
+        'image': 'https://images.unsplash.com/photo-1517694712202-14dd9538aa97?w=400',
+    })
+
+
+def make_user(i, pwhash, now):
+    return {
+        'full_name': f'Bench User {i}',
+        'email': user_email(i),
+        'password': pwhash,
+        'phone': '',
+        'location': '',
+        'bio': '',
+        'profile_image': None,
+        'created_at': now,
+    }
+
+
+def user_email(i):
+    return f'bench-user-{i}@example.com'
+
+
+def _insert(col, docs):
+    for i in range(0, len(docs), _BATCH):
+        col.insert_many(docs[i:i + _BATCH], ordered=False)
+
+
+def generate(db, jobs=10000, users=1000, applications=20000, seed=42):
+    """Replace the jobs, users, applications and counters collections with synthetic data
+
+    Indexes are built after loading, which is much faster than maintaining
+    them per insert. Returns the number of documents written per collection.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    for name in ('jobs', 'users', 'applications', 'counters'):
+        db[name].drop()
+
+    job_docs = [make_job(rng, i, now) for i in range(jobs)]
+    _insert(db['jobs'], job_docs)
+
+    pwhash = generate_password_hash(PASSWORD, password_hashing.HASH_METHOD)
+    user_docs = [make_user(i, pwhash, now) for i in range(users)]
+    _insert(db['users'], user_docs)
+
+    applications = min(applications, jobs * users)
+    statuses = [s for s, _ in STATUS_WEIGHTS]
+    weights = [w for _, w in STATUS_WEIGHTS]
+    pairs = set()
+    while len(pairs) < applications:
+        pairs.add((rng.randrange(users), rng.randrange(jobs)))
+    app_docs = []
+    for user_i, job_i in pairs:
+        job = job_docs[job_i]
+        app_docs.append({
+            'user_id': user_docs[user_i]['_id'],
+            'job_id': job['_id'],
+            'job_title': job['title'],
+            'company': job['company'],
+            'cover_letter': '',
+            'applied_at': now - timedelta(minutes=rng.randrange(90 * 24 * 60)),
+            'status': rng.choices(statuses, weights)[0],
+        })
+    _insert(db['applications'], app_docs)
+
+    for col_name, index_name, error in ensure_indexes(db):
+        print(f"✗ Could not create index {col_name}.{index_name}: {error}")
+    counters.reconcile(db)
+    return {'jobs': len(job_docs), 'users': len(user_docs), 'applications': len(app_docs)}
@@ -0,0 +1,107 @@
+"""Simulated visitors driving the app through Flask's test client"""
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+
+from bench import data
+
+
+_NEXT_PAGE = re.compile(r'href="(/jobs\?[^"]*cursor=[^"]+)"')
+
+
+class Recorder:
+    """Thread-safe latency, status and MongoDB op tallies per journey step"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.ops = defaultdict(int)
+        self.enabled = False
+
+    @property
+    def step(self):
+        return getattr(self._local, 'step', None)
+
+    def record(self, step, seconds, ok):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.latencies[step].append(seconds)
+            if not ok:
+                self.errors[step] += 1
+
+    def count_op(self):
+        step = self.step
+        if self.enabled and step is not None:
+            with self._lock:
+                self.ops[step] += 1
+
+    def start_step(self, step):
+        self._local.step = step
+
+    def end_step(self):
+        self._local.step = None
+
+
+class VirtualUser:
+    """One visitor with its own cookie jar and client address
+
+    Signed-in visitors browse, search, open a job, apply and check their
+    dashboard; anonymous ones stop after the job page. A share of journeys
+    also loads the admin applications panel.
+    """
+
+    def __init__(self, app, number, rng, recorder, job_ids, user_index=None, admin_share=0.0):
+        self.client = app.test_client()
+        self.client.environ_base['REMOTE_ADDR'] = f'10.{number // 65536 % 256}.{number // 256 % 256}.{number % 256}'
+        self.rng = rng
+        self.recorder = recorder
+        self.job_ids = job_ids
+        self.user_index = user_index
+        self.admin_share = admin_share
+
+    def request(self, step, method, path, expect=(200,), **kwargs):
+        self.recorder.start_step(step)
+        started = time.perf_counter()
+        try:
+            response = self.client.open(path, method=method, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.recorder.end_step()
+        self.recorder.record(step, elapsed, response.status_code in expect)
+        return response
+
+    def login(self):
+        if self.user_index is None:
+            return
+        self.request('login', 'POST', '/login', expect=(302,),
+                     data={'email': data.user_email(self.user_index), 'password': data.PASSWORD})
+
+    def journey(self):
+        rng = self.rng
+        path = '/jobs'
+        if rng.random() < 0.3:
+            path += '?category=' + rng.choice(tuple(data.ROLES)).replace(' ', '+')
+        page = self.request('jobs', 'GET', path)
+        match = _NEXT_PAGE.search(page.get_data(as_text=True))
+        if match and rng.random() < 0.5:
+            self.request('jobs', 'GET', match.group(1).replace('&amp;', '&'))
+
+        self.request('search', 'GET', '/jobs?search=' + rng.choice(data.SEARCH_TERMS).replace(' ', '+'))
+
+        job_id = rng.choice(self.job_ids)
+        self.request('job_detail', 'GET', f'/job/{job_id}')
+
+        if self.user_index is not None:
+            self.request('apply', 'POST', f'/job/{job_id}/apply', expect=(302,),
+                         data={'cover_letter': 'Benchmark application'})
+            self.request('dashboard', 'GET', '/dashboard')
+
+        if rng.random() < self.admin_share:
+            status = rng.choice(('', 'pending', 'accepted', 'rejected'))
+            self.request('admin_applications', 'GET', f'/admin/applications?status={status}',
+                         headers={'Authorization': f"Bearer {os.environ['ADMIN_API_TOKEN']}"})
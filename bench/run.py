@@ -0,0 +1,246 @@
+"""Benchmark the app end to end with synthetic data and concurrent visitors
+
+    python -m bench.run                                   # mongomock, small data set
+    MONGO_URI=mongodb://localhost:27017/ python -m bench.run --jobs 10000 \\
+        --users 5000 --applications 1000000 --concurrency 500 --duration 60
+
+Runs in-process through Flask's test client, one thread per visitor, so no
+server or network is involved. Data goes to the --db database (default
+MONGO_DB_NAME, else bench_fitapply), which is dropped and regenerated
+unless --reuse is given, so names not starting with "bench" are refused
+without --force. Results are printed and written to
+bench/results/<commit>.json; --compare reports p95 and throughput against
+the latest result from a different commit and exits non-zero on a
+regression.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+DEFAULT_DB = 'bench_fitapply'
+
+# counted as one MongoDB operation each; cursor getMores are not counted
+_OPS = {'find', 'find_one', 'find_one_and_update', 'aggregate', 'count_documents',
+        'insert_one', 'insert_many', 'update_one', 'update_many', 'bulk_write',
+        'delete_one', 'delete_many'}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--jobs', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--applications', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=20, help='simultaneous visitors')
+    parser.add_argument('--duration', type=float, default=20, help='seconds to measure')
+    parser.add_argument('--anonymous-share', type=float, default=0.5,
+                        help='fraction of visitors that never sign in')
+    parser.add_argument('--admin-share', type=float, default=0.1,
+                        help='fraction of journeys that also load the admin panel')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', default=os.environ.get('MONGO_DB_NAME', DEFAULT_DB),
+                        help='database to fill and drop (default: MONGO_DB_NAME or %(default)s)')
+    parser.add_argument('--force', action='store_true',
+                        help='allow a --db name that does not start with "bench"')
+    parser.add_argument('--reuse', action='store_true', help='keep the existing benchmark data')
+    parser.add_argument('--compare', action='store_true', help='compare with the previous commit')
+    parser.add_argument('--threshold', type=float, default=20,
+                        help='percent slowdown in p95 or throughput counted as a regression')
+    return parser.parse_args(argv)
+
+
+def count_ops(recorder):
+    """Attribute every collection call made through database.collection() to the current step"""
+    import database
+
+    lookup = database.LazyCollection.__getattr__
+
+    def counting_getattr(col, attr):
+        if attr in _OPS:
+            recorder.count_op()
+        return lookup(col, attr)
+
+    database.LazyCollection.__getattr__ = counting_getattr
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+    return {'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99),
+            'max': round(ordered[-1] * 1000, 2),
+            'mean': round(sum(ordered) / len(ordered) * 1000, 2)}
+
+
+def git_commit():
+    root = os.path.dirname(RESULTS_DIR)
+    try:
+        sha = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=root,
+                                      text=True, stderr=subprocess.DEVNULL).strip()
+        dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                        cwd=root, text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return sha, bool(dirty)
+
+
+def run(args):
+    os.environ.setdefault('MONGO_URI', 'mongomock://')
+    os.environ['MONGO_DB_NAME'] = args.db
+    os.environ.setdefault('ADMIN_API_TOKEN', 'bench')
+
+    import database
+    from app import app
+    from bench import data
+    from bench.journeys import Recorder, VirtualUser
+
+    db = database.get_db()
+    if args.reuse and db['jobs'].estimated_document_count():
+        print(f"✓ Reusing data in {database.MONGO_DB_NAME}")
+    else:
+        started = time.perf_counter()
+        written = data.generate(db, jobs=args.jobs, users=args.users,
+                                applications=args.applications, seed=args.seed)
+        print(f"✓ Generated {written['jobs']} jobs, {written['users']} users and "
+              f"{written['applications']} applications in {time.perf_counter() - started:.1f}s")
+
+    job_ids = [str(doc['_id']) for doc in db['jobs'].find({}, {'_id': 1})]
+    user_count = db['users'].count_documents({})
+
+    recorder = Recorder()
+    count_ops(recorder)
+    rng = random.Random(args.seed)
+    visitors = []
+    for number in range(args.concurrency):
+        signed_in = rng.random() >= args.anonymous_share and number < user_count
+        visitors.append(VirtualUser(app, number, random.Random(rng.random()), recorder, job_ids,
+                                    user_index=number if signed_in else None,
+                                    admin_share=args.admin_share))
+
+    # first requests build the search index and run the per-process bootstrap
+    visitors[0].journey()
+    for visitor in visitors:
+        visitor.login()
+
+    recorder.enabled = True
+    deadline = time.perf_counter() + args.duration
+    journeys = [0] * len(visitors)
+
+    def drive(i):
+        while time.perf_counter() < deadline:
+            visitors[i].journey()
+            journeys[i] += 1
+
+    threads = [threading.Thread(target=drive, args=(i,)) for i in range(len(visitors))]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    recorder.enabled = False
+
+    endpoints = {}
+    for step, samples in sorted(recorder.latencies.items()):
+        endpoints[step] = {
+            'requests': len(samples),
+            'errors': recorder.errors[step],
+            'rps': round(len(samples) / elapsed, 2),
+            'ops_per_request': round(recorder.ops[step] / len(samples), 2),
+            'latency_ms': percentiles(samples),
+        }
+
+    commit, dirty = git_commit()
+    return {
+        'commit': commit,
+        'dirty': dirty,
+        'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'backend': database.MONGO_URI.split('://', 1)[0],
+        'params': {k: getattr(args, k) for k in ('jobs', 'users', 'applications', 'concurrency',
+                                                 'duration', 'anonymous_share', 'admin_share', 'seed')},
+        'seconds': round(elapsed, 2),
+        'journeys': sum(journeys),
+        'rps': round(sum(e['requests'] for e in endpoints.values()) / elapsed, 2),
+        'endpoints': endpoints,
+    }
+
+
+def print_report(result):
+    print(f"\n{result['journeys']} journeys, {result['rps']} req/s over {result['seconds']}s "
+          f"({result['backend']}, commit {result['commit']}{'+dirty' if result['dirty'] else ''})\n")
+    print(f"{'step':<20}{'reqs':>7}{'err':>5}{'req/s':>9}{'ops':>6}"
+          f"{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for step, e in result['endpoints'].items():
+        lat = e['latency_ms']
+        print(f"{step:<20}{e['requests']:>7}{e['errors']:>5}{e['rps']:>9}{e['ops_per_request']:>6}"
+              f"{lat['p50']:>9}{lat['p95']:>9}{lat['p99']:>9}{lat['max']:>9}")
+
+
+def save(result):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{result['commit']}.json")
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2)
+    return path
+
+
+def previous_result(result):
+    """The newest saved result from another commit with the same parameters"""
+    candidates = []
+    for name in os.listdir(RESULTS_DIR):
+        if not name.endswith('.json'):
+            continue
+        with open(os.path.join(RESULTS_DIR, name)) as f:
+            other = json.load(f)
+        if other['commit'] != result['commit'] and other['params'] == result['params'] \
+                and other['backend'] == result['backend']:
+            candidates.append(other)
+    return max(candidates, key=lambda r: r['created_at'], default=None)
+
+
+def compare(result, baseline, threshold):
+    """Print per-step changes against `baseline`; returns the number of regressions"""
+    print(f"\nCompared with {baseline['commit']} ({baseline['created_at']}):")
+    regressions = 0
+    for step, e in result['endpoints'].items():
+        before = baseline['endpoints'].get(step)
+        if before is None:
+            continue
+        p95_change = (e['latency_ms']['p95'] / before['latency_ms']['p95'] - 1) * 100
+        rps_change = (e['rps'] / before['rps'] - 1) * 100 if before['rps'] else 0
+        worse = p95_change > threshold or rps_change < -threshold
+        regressions += worse
+        print(f"  {step:<20} p95 {p95_change:+7.1f}%   req/s {rps_change:+7.1f}%"
+              f"{'   ✗ regression' if worse else ''}")
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.db.startswith('bench') and not args.force:
+        print(f"✗ Refusing to benchmark against database {args.db!r}: it would be dropped. "
+              f"Use a name starting with 'bench', or --force")
+        return 2
+    result = run(args)
+    print_report(result)
+    print(f"\n✓ Saved {save(result)}")
+    if args.compare:
+        baseline = previous_result(result)
+        if baseline is None:
+            print("No earlier result with the same parameters to compare against")
+        elif compare(result, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
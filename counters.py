@@ -0,0 +1,243 @@
+"""Precomputed counters kept up to date with $inc
+
+Counter documents in the `counters` collection:
+
+    {'_id': 'global', 'jobs': n, 'users': n, 'applications': n,
+     'pending': n, 'accepted': n, 'rejected': n}
+    {'_id': 'user:<user_id>', 'total': n, 'pending': n, 'accepted': n, 'rejected': n}
+    {'_id': 'job:<job_id>', 'applicants': n}
+
+Run `flask --app app reconcile-counters` after deploying and whenever drift is
+suspected; it recomputes every counter from the source collections.
+"""
+from pymongo import UpdateOne, DeleteOne
+
+from dashboard_data import STATUSES
+
+
+GLOBAL = 'global'
+_BATCH_SIZE = 1000
+
+
+def user_key(user_id):
+    return f'user:{user_id}'
+
+
+def job_key(job_id):
+    return f'job:{job_id}'
+
+
+def increment(counters_col, key, **deltas):
+    """Atomically add `deltas` to the counter document `key`, creating it if needed"""
+    counters_col.update_one({'_id': key}, {'$inc': deltas}, upsert=True)
+
+
+def record_jobs_added(counters_col, count):
+    increment(counters_col, GLOBAL, jobs=count)
+
+
+def record_signup(counters_col):
+    increment(counters_col, GLOBAL, users=1)
+
+
+def record_application(counters_col, user_id, job_id, status='pending'):
+    """Count a new application globally, for its user and for its job in one round trip"""
+    record_applications(counters_col, [{'user_id': user_id, 'job_id': job_id, 'status': status}])
+
+
+def _application_ops(applications):
+    by_user = {}
+    by_job = {}
+    by_status = {'applications': len(applications)}
+    for application in applications:
+        deltas = by_user.setdefault(application['user_id'], {'total': 0})
+        deltas['total'] += 1
+        deltas[application['status']] = deltas.get(application['status'], 0) + 1
+        by_job[application['job_id']] = by_job.get(application['job_id'], 0) + 1
+        by_status[application['status']] = by_status.get(application['status'], 0) + 1
+
+    ops = [UpdateOne({'_id': GLOBAL}, {'$inc': by_status}, upsert=True)]
+    ops += [UpdateOne({'_id': user_key(user_id)}, {'$inc': deltas}, upsert=True)
+            for user_id, deltas in by_user.items()]
+    ops += [UpdateOne({'_id': job_key(job_id)}, {'$inc': {'applicants': n}}, upsert=True)
+            for job_id, n in by_job.items()]
+    return ops
+
+
+def record_applications(counters_col, applications):
+    """Count a batch of new applications with one $inc per touched counter document"""
+    ops = _application_ops(applications)
+    for i in range(0, len(ops), _BATCH_SIZE):
+        counters_col.bulk_write(ops[i:i + _BATCH_SIZE], ordered=False)
+
+
+async def record_applications_async(counters_col, applications):
+    ops = _application_ops(applications)
+    for i in range(0, len(ops), _BATCH_SIZE):
+        await counters_col.bulk_write(ops[i:i + _BATCH_SIZE], ordered=False)
+
+
+def record_status_change(counters_col, user_id, old_status, new_status):
+    record_status_changes(counters_col, [(user_id, old_status, new_status)])
+
+
+def record_status_changes(counters_col, changes):
+    """Count (user_id, old status, new status) changes with one $inc per touched user"""
+    by_user = {}
+    by_status = {}
+    for user_id, old_status, new_status in changes:
+        if old_status == new_status:
+            continue
+        deltas = by_user.setdefault(user_id, {})
+        deltas[old_status] = deltas.get(old_status, 0) - 1
+        deltas[new_status] = deltas.get(new_status, 0) + 1
+        by_status[old_status] = by_status.get(old_status, 0) - 1
+        by_status[new_status] = by_status.get(new_status, 0) + 1
+
+    ops = [UpdateOne({'_id': user_key(user_id)}, {'$inc': deltas}, upsert=True)
+           for user_id, deltas in by_user.items()]
+    if by_status:
+        ops.append(UpdateOne({'_id': GLOBAL}, {'$inc': by_status}, upsert=True))
+    for i in range(0, len(ops), _BATCH_SIZE):
+        counters_col.bulk_write(ops[i:i + _BATCH_SIZE], ordered=False)
+
+
+def recount_users(applications_col, counters_col, user_ids):
+    """Recompute the status counters of just these users from their applications
+
+    The global per-status counters are moved by the same amounts.
+    """
+    expected = {user_id: dict.fromkeys(STATUSES + ('total',), 0) for user_id in user_ids}
+    stored = {doc['_id']: doc for doc in
+              counters_col.find({'_id': {'$in': [user_key(u) for u in expected]}})}
+    rows = applications_col.aggregate([
+        {'$match': {'user_id': {'$in': list(expected)}}},
+        {'$group': {'_id': {'user_id': '$user_id', 'status': '$status'}, 'count': {'$sum': 1}}},
+    ])
+    for row in rows:
+        doc = expected[row['_id']['user_id']]
+        if row['_id']['status'] in STATUSES:
+            doc[row['_id']['status']] += row['count']
+        doc['total'] += row['count']
+
+    by_status = dict.fromkeys(STATUSES, 0)
+    for user_id, want in expected.items():
+        doc = stored.get(user_key(user_id), {})
+        for status in STATUSES:
+            by_status[status] += want[status] - doc.get(status, 0)
+
+    ops = [UpdateOne({'_id': user_key(user_id)}, {'$set': want}, upsert=True)
+           for user_id, want in expected.items()]
+    if any(by_status.values()):
+        ops.append(UpdateOne({'_id': GLOBAL}, {'$inc': by_status}, upsert=True))
+    for i in range(0, len(ops), _BATCH_SIZE):
+        counters_col.bulk_write(ops[i:i + _BATCH_SIZE], ordered=False)
+
+
+def global_counts(counters_col):
+    """Return {'jobs', 'users', 'applications'}, or None if never counted"""
+    doc = counters_col.find_one({'_id': GLOBAL})
+    if doc is None:
+        return None
+    return {k: doc.get(k, 0) for k in ('jobs', 'users', 'applications')}
+
+
+def _global_status_counts(doc):
+    if doc is None or any(status not in doc for status in STATUSES):
+        return None
+    counts = {status: doc[status] for status in STATUSES}
+    counts['total'] = doc.get('applications', 0)
+    return counts
+
+
+def global_status_counts(counters_col):
+    """Return all applications' per-status counts like dashboard_data.count_by_status, or None
+
+    None also when the global document predates the per-status fields; run
+    reconcile-counters to add them.
+    """
+    return _global_status_counts(counters_col.find_one({'_id': GLOBAL}))
+
+
+async def global_status_counts_async(counters_col):
+    return _global_status_counts(await counters_col.find_one({'_id': GLOBAL}))
+
+
+def _user_counts(doc):
+    if doc is None:
+        return None
+    counts = {status: doc.get(status, 0) for status in STATUSES}
+    counts['total'] = doc.get('total', 0)
+    return counts
+
+
+def user_status_counts(counters_col, user_id):
+    """Return per-status counts shaped like dashboard_data.status_counts, or None"""
+    return _user_counts(counters_col.find_one({'_id': user_key(user_id)}))
+
+
+async def user_status_counts_async(counters_col, user_id):
+    return _user_counts(await counters_col.find_one({'_id': user_key(user_id)}))
+
+
+def job_applicant_count(counters_col, job_id):
+    doc = counters_col.find_one({'_id': job_key(job_id)})
+    return doc.get('applicants', 0) if doc else 0
+
+
+async def job_applicant_count_async(counters_col, job_id):
+    doc = await counters_col.find_one({'_id': job_key(job_id)})
+    return doc.get('applicants', 0) if doc else 0
+
+
+def _expected_counters(db):
+    """Recompute every counter document from the source collections"""
+    expected = {GLOBAL: {
+        'jobs': db['jobs'].count_documents({}),
+        'users': db['users'].count_documents({}),
+        'applications': db['applications'].count_documents({}),
+        **dict.fromkeys(STATUSES, 0),
+    }}
+
+    by_user = db['applications'].aggregate([
+        {'$group': {'_id': {'user_id': '$user_id', 'status': '$status'}, 'count': {'$sum': 1}}},
+    ])
+    for row in by_user:
+        doc = expected.setdefault(user_key(row['_id']['user_id']),
+                                  dict.fromkeys(STATUSES + ('total',), 0))
+        if row['_id']['status'] in STATUSES:
+            doc[row['_id']['status']] += row['count']
+            expected[GLOBAL][row['_id']['status']] += row['count']
+        doc['total'] += row['count']
+
+    by_job = db['applications'].aggregate([
+        {'$group': {'_id': '$job_id', 'count': {'$sum': 1}}},
+    ])
+    for row in by_job:
+        expected[job_key(row['_id'])] = {'applicants': row['count']}
+    return expected
+
+
+def reconcile(db):
+    """Rewrite drifted counters and drop orphaned ones; returns the number of documents fixed
+
+    Increments that land while this runs can be overwritten, so run it when
+    writes are quiet.
+    """
+    counters_col = db['counters']
+    expected = _expected_counters(db)
+
+    ops = []
+    for doc in counters_col.find():
+        key = doc.pop('_id')
+        want = expected.pop(key, None)
+        if want is None:
+            ops.append(DeleteOne({'_id': key}))
+        elif any(doc.get(k, 0) != v for k, v in want.items()):
+            ops.append(UpdateOne({'_id': key}, {'$set': want}))
+    for key, want in expected.items():
+        ops.append(UpdateOne({'_id': key}, {'$set': want}, upsert=True))
+
+    for i in range(0, len(ops), _BATCH_SIZE):
+        counters_col.bulk_write(ops[i:i + _BATCH_SIZE], ordered=False)
+    return len(ops)
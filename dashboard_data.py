@@ -0,0 +1,65 @@
+"""Queries behind the user dashboard"""
+from pagination import keyset_page, keyset_page_async
+
+
+STATUSES = ('pending', 'accepted', 'rejected')
+PAGE_SIZE = 20
+
+_SORT_FIELDS = ('applied_at', '_id')
+_LIST_PROJECTION = {'job_id': 1, 'job_title': 1, 'company': 1, 'applied_at': 1, 'status': 1}
+
+
+def _status_pipeline(match, limit=None):
+    pipeline = [{'$match': match}]
+    if limit:
+        pipeline.append({'$limit': limit})
+    pipeline.append({'$group': {'_id': '$status', 'count': {'$sum': 1}}})
+    return pipeline
+
+
+def _tally(rows):
+    counts = dict.fromkeys(STATUSES, 0)
+    total = 0
+    for row in rows:
+        if row['_id'] in counts:
+            counts[row['_id']] = row['count']
+        total += row['count']
+    counts['total'] = total
+    return counts
+
+
+def count_by_status(applications_col, match, limit=None):
+    """Count applications matching `match` per status with a single $group
+
+    With `limit`, only the first `limit` matches are counted.
+    """
+    return _tally(applications_col.aggregate(_status_pipeline(match, limit)))
+
+
+async def count_by_status_async(applications_col, match, limit=None):
+    """count_by_status for a motor collection"""
+    rows = await applications_col.aggregate(_status_pipeline(match, limit)).to_list(None)
+    return _tally(rows)
+
+
+def status_counts(applications_col, user_id):
+    """Count a user's applications per status"""
+    return count_by_status(applications_col, {'user_id': user_id})
+
+
+async def status_counts_async(applications_col, user_id):
+    return await count_by_status_async(applications_col, {'user_id': user_id})
+
+
+def application_page(applications_col, user_id, cursor=None, page_size=PAGE_SIZE):
+    """Return (applications, next_cursor), most recent first
+
+    next_cursor is None on the last page.
+    """
+    return keyset_page(applications_col, {'user_id': user_id}, _LIST_PROJECTION,
+                       _SORT_FIELDS, cursor=cursor, page_size=page_size)
+
+
+async def application_page_async(applications_col, user_id, cursor=None, page_size=PAGE_SIZE):
+    return await keyset_page_async(applications_col, {'user_id': user_id}, _LIST_PROJECTION,
+                                   _SORT_FIELDS, cursor=cursor, page_size=page_size)
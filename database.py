@@ -0,0 +1,209 @@
+"""MongoDB connection management
+
+The client is created lazily on first use and re-created after a fork, so
+pre-fork servers such as gunicorn give every worker its own connection pool.
+The ASGI entry point (asgi.py) additionally uses a motor client built from
+the same settings; motor is only imported when that is asked for.
+Settings come from the environment:
+
+    MONGO_URI                          mongodb://localhost:27017/
+    MONGO_DB_NAME                      fitapply
+    MONGO_MAX_POOL_SIZE                100
+    MONGO_MIN_POOL_SIZE                0
+    MONGO_WAIT_QUEUE_TIMEOUT_MS        2000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS  5000
+    MONGO_READ_PREFERENCE              primary
+    MONGO_WRITE_CONCERN                1      (or 'majority')
+
+MONGO_URI=mongomock:// swaps in an in-process mongomock client (pool
+settings do not apply), for benchmarks and demos without a mongod.
+"""
+import os
+import threading
+import time
+
+from pymongo import MongoClient, monitoring
+
+
+MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/')
+MONGO_DB_NAME = os.environ.get('MONGO_DB_NAME', 'fitapply')
+MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 100))
+MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 0))
+WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000))
+SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+READ_PREFERENCE = os.environ.get('MONGO_READ_PREFERENCE', 'primary')
+WRITE_CONCERN = os.environ.get('MONGO_WRITE_CONCERN', '1')
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool counters for the current process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.open = 0
+            self.checked_out = 0
+            self.max_checked_out = 0
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.wait_timeouts = 0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'max_pool_size': MAX_POOL_SIZE,
+                'open': self.open,
+                'checked_out': self.checked_out,
+                'max_checked_out': self.max_checked_out,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'wait_timeouts': self.wait_timeouts,
+            }
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.wait_timeouts += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+
+pool_stats = PoolStats()
+
+_lock = threading.Lock()
+_client = None
+_client_pid = None
+_async_client = None
+_async_client_pid = None
+
+
+def _write_concern():
+    return int(WRITE_CONCERN) if WRITE_CONCERN.isdigit() else WRITE_CONCERN
+
+
+def _client_options():
+    return dict(
+        maxPoolSize=MAX_POOL_SIZE,
+        minPoolSize=MIN_POOL_SIZE,
+        waitQueueTimeoutMS=WAIT_QUEUE_TIMEOUT_MS,
+        serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS,
+        readPreference=READ_PREFERENCE,
+        w=_write_concern(),
+        event_listeners=[pool_stats],
+    )
+
+
+def _mongomock_client():
+    import mongomock
+
+    # mongomock edits projection dicts in place while applying them, which
+    # races when request threads share the module-level projections
+    copy_only_fields = mongomock.collection.Collection._copy_only_fields
+    if not getattr(copy_only_fields, 'copies_fields', False):
+        def _copy_only_fields(self, doc, fields, container):
+            if isinstance(fields, dict):
+                fields = dict(fields)
+            return copy_only_fields(self, doc, fields, container)
+        _copy_only_fields.copies_fields = True
+        mongomock.collection.Collection._copy_only_fields = _copy_only_fields
+    return mongomock.MongoClient()
+
+
+def _create_client():
+    if MONGO_URI.startswith('mongomock://'):
+        return _mongomock_client()
+    return MongoClient(MONGO_URI, **_client_options())
+
+
+def get_client():
+    """Return this process's MongoClient, creating it on first use or after a fork"""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _lock:
+        if _client is None or _client_pid != pid:
+            # a client inherited across fork() must not be reused; its sockets
+            # are shared with the parent
+            pool_stats.reset()
+            _client = _create_client()
+            _client_pid = pid
+        return _client
+
+
+def get_db():
+    return get_client()[MONGO_DB_NAME]
+
+
+def get_async_db():
+    """Return this process's motor database, creating the client on first use or after a fork"""
+    global _async_client, _async_client_pid
+    pid = os.getpid()
+    with _lock:
+        if _async_client is None or _async_client_pid != pid:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            _async_client = AsyncIOMotorClient(MONGO_URI, **_client_options())
+            _async_client_pid = pid
+        return _async_client[MONGO_DB_NAME]
+
+
+def ping():
+    """Round-trip to the server; returns the latency in milliseconds"""
+    start = time.perf_counter()
+    get_client().admin.command('ping')
+    return (time.perf_counter() - start) * 1000
+
+
+class LazyCollection:
+    """Stand-in for a pymongo Collection that resolves it on each use"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(get_db()[self.name], attr)
+
+    def __repr__(self):
+        return f'LazyCollection({self.name!r})'
+
+
+def collection(name):
+    return LazyCollection(name)
@@ -0,0 +1,21 @@
+"""Minimal in-process publish/subscribe for data-change events"""
+from collections import defaultdict
+
+
+JOBS_CHANGED = 'jobs_changed'
+USERS_CHANGED = 'users_changed'
+APPLICATIONS_CHANGED = 'applications_changed'
+
+_subscribers = defaultdict(list)
+
+
+def subscribe(event, handler):
+    """Call handler(**payload) every time `event` is published"""
+    _subscribers[event].append(handler)
+    return handler
+
+
+def publish(event, **payload):
+    """Notify every subscriber of `event`; subscribers run synchronously in order"""
+    for handler in _subscribers[event]:
+        handler(**payload)
@@ -0,0 +1,66 @@
+"""Cached filter facets (category, location, remote/onsite counts) for /jobs"""
+import os
+import threading
+import time
+
+import events
+
+
+FACET_TTL = int(os.environ.get('FACET_CACHE_TTL', 300))
+
+_EMPTY = {'categories': [], 'locations': [], 'remote': 0, 'onsite': 0}
+
+_lock = threading.Lock()
+_cached = None
+_expires_at = 0.0
+
+
+def compute_facets(jobs_col):
+    """Count jobs per category, per location and remote vs onsite in one aggregation"""
+    pipeline = [{'$facet': {
+        'categories': [
+            {'$group': {'_id': '$category', 'count': {'$sum': 1}}},
+            {'$sort': {'_id': 1}},
+        ],
+        'locations': [
+            {'$group': {'_id': '$location', 'count': {'$sum': 1}}},
+            {'$sort': {'count': -1, '_id': 1}},
+        ],
+        'remote': [
+            {'$group': {'_id': {'$ifNull': ['$remote', False]}, 'count': {'$sum': 1}}},
+        ],
+    }}]
+    result = next(jobs_col.aggregate(pipeline), None)
+    if result is None:
+        return dict(_EMPTY)
+
+    remote = {row['_id']: row['count'] for row in result['remote']}
+    return {
+        'categories': [(row['_id'], row['count']) for row in result['categories'] if row['_id']],
+        'locations': [(row['_id'], row['count']) for row in result['locations'] if row['_id']],
+        'remote': remote.get(True, 0),
+        'onsite': remote.get(False, 0),
+    }
+
+
+def get_facets(jobs_col):
+    """Return the facet counts, recomputing them at most once per FACET_TTL seconds"""
+    global _cached, _expires_at
+    now = time.monotonic()
+    if _cached is not None and now < _expires_at:
+        return _cached
+    with _lock:
+        if _cached is None or time.monotonic() >= _expires_at:
+            _cached = compute_facets(jobs_col)
+            _expires_at = time.monotonic() + FACET_TTL
+        return _cached
+
+
+def invalidate():
+    """Drop the cached facets; call after inserting, updating or deleting jobs"""
+    global _cached
+    with _lock:
+        _cached = None
+
+
+events.subscribe(events.JOBS_CHANGED, lambda **_: invalidate())
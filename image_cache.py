@@ -0,0 +1,275 @@
+"""Local copies of remote job images and avatars
+
+Job cards and profiles point at images on a few external hosts (Unsplash
+photos, ui-avatars initials). image_url() rewrites those URLs to /images,
+which downloads each image once, stores it under IMAGE_CACHE_DIR and serves
+it from there with a long max-age. With Pillow installed the copy is also
+resized to the width the page displays it at, rounded up to one of
+THUMBNAIL_WIDTHS so the number of variants stays small.
+
+Only hosts listed in IMAGE_PROXY_HOSTS are fetched; other URLs are left as
+they are. The links image_url() produces carry an HMAC of the URL and width
+keyed on the app's secret key, and /images refuses any other combination, so
+it cannot be used to fill the cache with arbitrary files. The cache is kept
+under IMAGE_CACHE_MAX_BYTES by deleting the least recently served files.
+A failed download is remembered for IMAGE_FAILURE_TTL seconds so a dead
+host is not retried by every page view.
+"""
+import hashlib
+import hmac
+import io
+import os
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from flask import current_app, url_for
+
+
+IMAGE_PROXY_HOSTS = frozenset(h.strip() for h in os.environ.get(
+    'IMAGE_PROXY_HOSTS', 'images.unsplash.com,ui-avatars.com').split(',') if h.strip())
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', 'image_cache')
+IMAGE_CACHE_MAX_AGE = int(os.environ.get('IMAGE_CACHE_MAX_AGE', 30 * 24 * 3600))
+IMAGE_FETCH_TIMEOUT = float(os.environ.get('IMAGE_FETCH_TIMEOUT', 5))
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+IMAGE_FAILURE_TTL = float(os.environ.get('IMAGE_FAILURE_TTL', 60))
+
+_MAX_FAILURES = 4096
+
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+THUMBNAIL_WIDTHS = (64, 128, 256, 400, 512, 800, 1200)
+
+# content type -> file extension; anything else is refused, notably SVG,
+# which can carry scripts and would be served from our own origin
+EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/webp': '.webp',
+    'image/gif': '.gif',
+}
+_MIMETYPES = {ext: mimetype for mimetype, ext in EXTENSIONS.items()}
+# formats Pillow resizes; gifs may be animated
+_RESIZABLE = {'.jpg': 'JPEG', '.png': 'PNG', '.webp': 'WEBP'}
+
+
+class ImageUnavailable(Exception):
+    """The remote image could not be fetched or is not an image"""
+
+
+def is_proxied(url):
+    parts = urlsplit(url or '')
+    return parts.scheme in ('http', 'https') and parts.hostname in IMAGE_PROXY_HOSTS
+
+
+def thumbnail_width(width):
+    """The smallest THUMBNAIL_WIDTHS entry at least `width` wide, or None for full size"""
+    if not width:
+        return None
+    return next((w for w in THUMBNAIL_WIDTHS if w >= width), None)
+
+
+def signature(url, width):
+    """HMAC of a proxied URL and thumbnail width under the app's secret key"""
+    message = f'{url}|{width or ""}'.encode('utf-8')
+    key = current_app.secret_key.encode('utf-8')
+    return hmac.new(key, message, hashlib.sha256).hexdigest()[:32]
+
+
+def valid_signature(url, width, sig):
+    return bool(sig) and hmac.compare_digest(signature(url, width), sig)
+
+
+def image_url(url, width=None):
+    """Template helper: the signed local URL for a proxied image, other URLs unchanged"""
+    if not is_proxied(url):
+        return url
+    width = thumbnail_width(width)
+    return url_for('proxied_image', url=url, w=width, sig=signature(url, width))
+
+
+def _key(url, width):
+    return hashlib.sha256(f'{url}|{width or ""}'.encode('utf-8')).hexdigest()
+
+
+def _cached(key):
+    for ext, mimetype in _MIMETYPES.items():
+        path = os.path.join(IMAGE_CACHE_DIR, key[:2], key + ext)
+        try:
+            # the modification time doubles as last use, for eviction
+            os.utime(path)
+        except OSError:
+            continue
+        return path, mimetype
+    return None
+
+
+def _download(url):
+    request = urllib.request.Request(url, headers={'User-Agent': 'FitApply image cache'})
+    try:
+        with urllib.request.urlopen(request, timeout=IMAGE_FETCH_TIMEOUT) as response:
+            mimetype = response.headers.get_content_type()
+            data = response.read(MAX_IMAGE_BYTES + 1)
+    except (OSError, ValueError) as e:
+        raise ImageUnavailable(f'{url}: {e}') from e
+    if mimetype not in EXTENSIONS:
+        raise ImageUnavailable(f'{url}: unsupported content type {mimetype}')
+    if len(data) > MAX_IMAGE_BYTES:
+        raise ImageUnavailable(f'{url}: larger than {MAX_IMAGE_BYTES} bytes')
+    return data, EXTENSIONS[mimetype]
+
+
+def _resize(data, ext, width):
+    """Scale down to `width` with Pillow if it is installed; otherwise return the original"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return data
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.width <= width:
+                return data
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+            out = io.BytesIO()
+            resized.save(out, format=_RESIZABLE[ext], optimize=True,
+                         **({'quality': 85} if ext != '.png' else {}))
+            return out.getvalue()
+    except (OSError, ValueError):
+        return data
+
+
+_size_lock = threading.Lock()
+_cache_bytes = None     # this process's running estimate, corrected by each eviction
+
+
+def _cache_files():
+    for root, _, files in os.walk(IMAGE_CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            yield stat.st_mtime, stat.st_size, path
+
+
+def _evict():
+    """Delete the least recently served files until the cache is under 90% of its cap"""
+    files = sorted(_cache_files())
+    total = sum(size for _, size, _ in files)
+    target = IMAGE_CACHE_MAX_BYTES * 0.9
+    for _, size, path in files:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+    return total
+
+
+def _stored(size):
+    """Account for a newly written file, evicting when the cache outgrows its cap"""
+    global _cache_bytes
+    with _size_lock:
+        if _cache_bytes is None:
+            _cache_bytes = sum(size for _, size, _ in _cache_files())
+        else:
+            _cache_bytes += size
+        if _cache_bytes > IMAGE_CACHE_MAX_BYTES:
+            _cache_bytes = _evict()
+
+
+_failures_lock = threading.Lock()
+_failures = OrderedDict()   # url -> (retry_at, message)
+
+
+def _failed(url):
+    """The message of a recent failed download of `url`, if it should not be retried yet"""
+    with _failures_lock:
+        failure = _failures.get(url)
+        if failure is None:
+            return None
+        if failure[0] <= time.monotonic():
+            del _failures[url]
+            return None
+        return failure[1]
+
+
+def _remember_failure(url, message):
+    with _failures_lock:
+        _failures[url] = (time.monotonic() + IMAGE_FAILURE_TTL, message)
+        _failures.move_to_end(url)
+        while len(_failures) > _MAX_FAILURES:
+            _failures.popitem(last=False)
+
+
+_locks_lock = threading.Lock()
+_locks = {}     # key -> [lock, callers holding or waiting for it]
+
+
+def _acquire(key):
+    with _locks_lock:
+        entry = _locks.get(key)
+        if entry is None:
+            entry = _locks[key] = [threading.Lock(), 0]
+        entry[1] += 1
+    entry[0].acquire()
+
+
+def _release(key):
+    with _locks_lock:
+        entry = _locks[key]
+        entry[0].release()
+        entry[1] -= 1
+        if not entry[1]:
+            del _locks[key]
+
+
+def fetch(url, width=None):
+    """Return (path, mimetype) of the local copy, downloading it on first use
+
+    Concurrent requests for the same image wait for a single download.
+    Raises ImageUnavailable when the remote image cannot be used, or could
+    not be within the last IMAGE_FAILURE_TTL seconds.
+    """
+    width = thumbnail_width(width)
+    key = _key(url, width)
+    found = _cached(key)
+    if found is not None:
+        return found
+    failure = _failed(url)
+    if failure is not None:
+        raise ImageUnavailable(failure)
+
+    # the lock stays registered while anyone holds or waits for it, so every
+    # caller for this key serialises on the same one until the file is written
+    _acquire(key)
+    try:
+        found = _cached(key)
+        if found is not None:
+            return found
+        failure = _failed(url)
+        if failure is not None:
+            raise ImageUnavailable(failure)
+        try:
+            data, ext = _download(url)
+        except ImageUnavailable as e:
+            _remember_failure(url, str(e))
+            raise
+        if width and ext in _RESIZABLE:
+            data = _resize(data, ext, width)
+
+        path = os.path.join(IMAGE_CACHE_DIR, key[:2], key + ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = f'{path}.{os.getpid()}.{threading.get_ident()}.part'
+        with open(partial, 'wb') as f:
+            f.write(data)
+        os.replace(partial, path)
+    finally:
+        _release(key)
+    _stored(len(data))
+    return path, _MIMETYPES[ext]
@@ -0,0 +1,89 @@
+"""MongoDB index bootstrap for the FitApply collections"""
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, TEXT
+from pymongo.errors import OperationFailure
+
+
+# collection -> list of (name, keys, options)
+INDEX_SPECS = {
+    'users': [
+        ('email_unique', [('email', ASCENDING)], {'unique': True}),
+    ],
+    'applications': [
+        ('user_job_unique', [('user_id', ASCENDING), ('job_id', ASCENDING)], {'unique': True}),
+        ('user_status', [('user_id', ASCENDING), ('status', ASCENDING)], {}),
+        ('user_applied_at', [('user_id', ASCENDING), ('applied_at', DESCENDING), ('_id', DESCENDING)], {}),
+        ('job_applied_at', [('job_id', ASCENDING), ('applied_at', DESCENDING)], {}),
+        ('applied_at', [('applied_at', DESCENDING), ('_id', DESCENDING)], {}),
+        ('status_applied_at', [('status', ASCENDING), ('applied_at', DESCENDING), ('_id', DESCENDING)], {}),
+        ('company_applied_at', [('company', ASCENDING), ('applied_at', DESCENDING), ('_id', DESCENDING)], {}),
+        # live_updates polls this when change streams are unavailable
+        ('status_changed_at', [('status_changed_at', ASCENDING)],
+         {'partialFilterExpression': {'status_changed_at': {'$exists': True}}}),
+    ],
+    'jobs': [
+        ('external_key_unique', [('external_key', ASCENDING)],
+         {'unique': True, 'partialFilterExpression': {'external_key': {'$exists': True}}}),
+        ('location_posted_at', [('location', ASCENDING), ('posted_at', DESCENDING), ('_id', DESCENDING)], {}),
+        ('remote_posted_at', [('remote', ASCENDING), ('posted_at', DESCENDING), ('_id', DESCENDING)], {}),
+        ('salary_max', [('salary_max', DESCENDING), ('_id', DESCENDING)], {}),
+        ('category_salary_max', [('category', ASCENDING), ('salary_max', DESCENDING), ('_id', DESCENDING)], {}),
+        # newest-first pages, optionally filtered by salary: the sort keys come
+        # first and the salary bounds are checked from the index keys without
+        # fetching documents; unfiltered pages use the same indexes as prefixes
+        ('posted_at_salary', [('posted_at', DESCENDING), ('_id', DESCENDING),
+                              ('salary_max', DESCENDING), ('salary_min', ASCENDING)], {}),
+        ('category_posted_at_salary', [('category', ASCENDING), ('posted_at', DESCENDING), ('_id', DESCENDING),
+                                       ('salary_max', DESCENDING), ('salary_min', ASCENDING)], {}),
+        ('geo_2dsphere', [('geo', GEOSPHERE)], {}),
+        ('job_text', [('title', TEXT), ('description', TEXT), ('requirements', TEXT)],
+         {'weights': {'title': 10, 'requirements': 5, 'description': 1},
+          'default_language': 'english'}),
+    ],
+}
+
+
+def ensure_indexes(db):
+    """Create every index in INDEX_SPECS; safe to run repeatedly.
+
+    Returns a list of (collection, index name, error) for indexes that could
+    not be built, e.g. a unique index over data that already has duplicates.
+    """
+    failures = []
+    for col_name, specs in INDEX_SPECS.items():
+        col = db[col_name]
+        for name, keys, options in specs:
+            try:
+                col.create_index(keys, name=name, **options)
+            except OperationFailure as e:
+                failures.append((col_name, name, str(e)))
+    return failures
+
+
+def _index_usage(col):
+    """Map index name -> number of operations that used it, if the server reports it"""
+    try:
+        return {s['name']: s['accesses']['ops'] for s in col.aggregate([{'$indexStats': {}}])}
+    except OperationFailure:
+        return {}
+
+
+def index_report(db):
+    """Describe expected indexes that are missing and existing ones never used"""
+    report = {'missing': [], 'unused': []}
+    for col_name, specs in INDEX_SPECS.items():
+        col = db[col_name]
+        existing = col.index_information()
+        existing_keys = {tuple(info['key']) for info in existing.values()}
+        for name, keys, options in specs:
+            if name in existing:
+                continue
+            # text indexes are stored as _fts/_ftsx, so compare those by name only
+            if not any(k[1] == TEXT for k in keys) and tuple(keys) in existing_keys:
+                continue
+            report['missing'].append((col_name, name))
+
+        usage = _index_usage(col)
+        for name, ops in usage.items():
+            if name != '_id_' and ops == 0:
+                report['unused'].append((col_name, name))
+    return report
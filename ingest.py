@@ -0,0 +1,192 @@
+"""Streaming bulk import of partner job feeds
+
+Feeds are NDJSON (one job object per line) or CSV with a header row; in CSV
+the requirements column separates items with ';'. Every record needs an
+external_key, which identifies the job across imports: records upsert on
+it, so re-importing a feed updates jobs instead of duplicating them.
+
+Records are read, validated and written one batch at a time with unordered
+bulk writes, so memory use does not grow with the size of the feed.
+"""
+import csv
+import json
+import os
+import time
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+import counters
+import events
+from normalize import normalize_job
+
+
+BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', 1000))
+MAX_REPORTED_REJECTS = 100
+
+REQUIRED_FIELDS = ('external_key', 'title', 'company', 'category', 'location', 'description')
+OPTIONAL_FIELDS = ('salary', 'image')
+MAX_FIELD_LENGTH = 5000
+
+# fields the search index needs when it is told about imported jobs
+_INDEXED_FIELDS = {'title': 1, 'company': 1, 'requirements': 1, 'description': 1, 'posted_at': 1,
+                   'salary_min': 1, 'salary_max': 1, 'category': 1, 'location': 1, 'remote': 1,
+                   'geo': 1}
+
+
+def read_ndjson(stream):
+    """Yield (line number, record or error message) from an NDJSON text stream"""
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, f'invalid JSON: {e}'
+            continue
+        yield line_no, record if isinstance(record, dict) else 'expected a JSON object'
+
+
+def read_csv(stream):
+    """Yield (line number, record) from a CSV text stream with a header row"""
+    reader = csv.DictReader(stream)
+    for record in reader:
+        requirements = record.get('requirements') or ''
+        record['requirements'] = [r.strip() for r in requirements.split(';') if r.strip()]
+        yield reader.line_num, record
+
+
+READERS = {'ndjson': read_ndjson, 'csv': read_csv}
+
+
+def validate(record):
+    """Return a job document built from `record`, or raise ValueError"""
+    job = {}
+    for field in REQUIRED_FIELDS + OPTIONAL_FIELDS:
+        value = record.get(field)
+        if value is None or value == '':
+            if field in REQUIRED_FIELDS:
+                raise ValueError(f'missing {field}')
+            continue
+        if not isinstance(value, (str, int)):
+            raise ValueError(f'{field} must be a string')
+        value = str(value).strip()
+        if len(value) > MAX_FIELD_LENGTH:
+            raise ValueError(f'{field} is too long')
+        job[field] = value
+
+    requirements = record.get('requirements') or []
+    if not isinstance(requirements, list) or not all(isinstance(r, str) for r in requirements):
+        raise ValueError('requirements must be a list of strings')
+    job['requirements'] = [r.strip() for r in requirements if r.strip()]
+
+    posted_at = record.get('posted_at')
+    if posted_at:
+        try:
+            job['posted_at'] = datetime.fromisoformat(str(posted_at).replace('Z', '+00:00'))
+        except ValueError:
+            raise ValueError('posted_at must be an ISO 8601 date')
+
+    return normalize_job(job)
+
+
+def _upsert(job, now):
+    on_insert = {'created_at': now}
+    if 'posted_at' not in job:
+        on_insert['posted_at'] = now
+    job['updated_at'] = now
+    return UpdateOne({'external_key': job['external_key']},
+                     {'$set': job, '$setOnInsert': on_insert}, upsert=True)
+
+
+def _write_batch(jobs_col, counters_col, ops, keys):
+    """Run one unordered bulk write; returns (upserted, modified, write errors)"""
+    try:
+        result = jobs_col.bulk_write(ops, ordered=False)
+        details = result.bulk_api_result
+    except BulkWriteError as e:
+        details = e.details
+
+    upserted = details.get('nUpserted', 0)
+    errors = [(keys[err['index']], err.get('errmsg', 'write failed'))
+              for err in details.get('writeErrors', [])]
+    if upserted:
+        counters.record_jobs_added(counters_col, upserted)
+
+    # let the search index and caches see the batch without a full rebuild
+    written = list(jobs_col.find({'external_key': {'$in': keys}}, _INDEXED_FIELDS))
+    events.publish(events.JOBS_CHANGED, jobs=written)
+    return upserted, details.get('nModified', 0), errors
+
+
+def ingest(jobs_col, counters_col, records, batch_size=BATCH_SIZE):
+    """Import (line number, record) pairs in batches, yielding a report per batch
+
+    Each report holds the batch number, record counts, the time taken, the
+    throughput in records per second and the records it rejected.
+    """
+    batch_no = 0
+    ops, keys, rejects = [], [], []
+    started = time.perf_counter()
+
+    def flush():
+        nonlocal ops, keys, rejects, started, batch_no
+        batch_no += 1
+        processed = len(ops) + len(rejects)
+        upserted, modified, errors = (_write_batch(jobs_col, counters_col, ops, keys)
+                                      if ops else (0, 0, []))
+        rejects += [{'external_key': key, 'error': error} for key, error in errors]
+        seconds = time.perf_counter() - started
+        report = {
+            'batch': batch_no,
+            'processed': processed,
+            'upserted': upserted,
+            'modified': modified,
+            'rejected': len(rejects),
+            'seconds': round(seconds, 3),
+            'records_per_second': round(processed / seconds, 1) if seconds else None,
+            'rejects': rejects[:MAX_REPORTED_REJECTS],
+        }
+        ops, keys, rejects = [], [], []
+        started = time.perf_counter()
+        return report
+
+    now = datetime.utcnow()
+    for line_no, record in records:
+        try:
+            if isinstance(record, str):
+                raise ValueError(record)
+            job = validate(record)
+        except ValueError as e:
+            rejects.append({'line': line_no, 'error': str(e)})
+        else:
+            ops.append(_upsert(job, now))
+            keys.append(job['external_key'])
+        if len(ops) + len(rejects) >= batch_size:
+            yield flush()
+            now = datetime.utcnow()
+
+    if ops or rejects:
+        yield flush()
+
+
+def summarize(reports):
+    """Fold per-batch reports into totals, keeping the first MAX_REPORTED_REJECTS rejects
+
+    `reports` is consumed as it is produced, so pass ingest()'s generator
+    directly; no report outlives its batch.
+    """
+    summary = {'batches': 0, 'processed': 0, 'upserted': 0, 'modified': 0, 'rejected': 0,
+               'seconds': 0.0, 'rejects': []}
+    for report in reports:
+        summary['batches'] += 1
+        for field in ('processed', 'upserted', 'modified', 'rejected', 'seconds'):
+            summary[field] += report[field]
+        room = MAX_REPORTED_REJECTS - len(summary['rejects'])
+        summary['rejects'] += report['rejects'][:room]
+    summary['seconds'] = round(summary['seconds'], 3)
+    if summary['seconds']:
+        summary['records_per_second'] = round(summary['processed'] / summary['seconds'], 1)
+    return summary
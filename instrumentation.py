@@ -0,0 +1,300 @@
+"""Per-request timing, MongoDB command stats and Prometheus metrics
+
+Every request is split into time spent in MongoDB commands, in template
+rendering and everything else. The split goes out as a Server-Timing header
+and is aggregated per endpoint for /metrics. All numbers are per process.
+
+Set PROFILE_SLOW_REQUESTS_MS to sample the stacks of requests that take at
+least that long; each one is written to PROFILE_DIR (default ./profiles) in
+collapsed-stack format, ready for flamegraph.pl or speedscope.
+"""
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import before_render_template, template_rendered
+from pymongo import monitoring
+
+
+PROFILE_SLOW_REQUESTS_MS = float(os.environ.get('PROFILE_SLOW_REQUESTS_MS', 0))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+class RequestMetrics:
+    __slots__ = ('started', 'db_seconds', 'commands', 'docs', 'render_seconds', 'render_started')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_seconds = 0.0
+        self.commands = 0
+        self.docs = 0
+        self.render_seconds = 0.0
+        self.render_started = None
+
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+def _docs_in_reply(reply):
+    cursor = reply.get('cursor')
+    if isinstance(cursor, dict):
+        return len(cursor.get('firstBatch') or cursor.get('nextBatch') or ())
+    return reply.get('n', 0) if isinstance(reply.get('n'), int) else 0
+
+
+class CommandStats(monitoring.CommandListener):
+    """Counts and times every MongoDB command, per command name and per request
+
+    Commands are attributed to the request running on the calling thread;
+    those issued from motor's worker threads only reach the per-command totals.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = Counter()
+        self.seconds = Counter()
+        self.failures = Counter()
+        self.docs = Counter()
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        seconds = event.duration_micros / 1e6
+        docs = _docs_in_reply(event.reply)
+        with self._lock:
+            self.count[event.command_name] += 1
+            self.seconds[event.command_name] += seconds
+            self.docs[event.command_name] += docs
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.commands += 1
+            metrics.db_seconds += seconds
+            metrics.docs += docs
+
+    def failed(self, event):
+        seconds = event.duration_micros / 1e6
+        with self._lock:
+            self.count[event.command_name] += 1
+            self.seconds[event.command_name] += seconds
+            self.failures[event.command_name] += 1
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.commands += 1
+            metrics.db_seconds += seconds
+
+
+class EndpointStats:
+    """Request counts, latency histograms and the DB/render split per endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter()
+        self.buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+        self.count = Counter()
+        self.seconds = Counter()
+        self.db_seconds = Counter()
+        self.render_seconds = Counter()
+        self.commands = Counter()
+        self.docs = Counter()
+
+    def record(self, endpoint, method, status, metrics, total):
+        with self._lock:
+            self.requests[(endpoint, method, status)] += 1
+            buckets = self.buckets[endpoint]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if total <= bound:
+                    buckets[i] += 1
+            self.count[endpoint] += 1
+            self.seconds[endpoint] += total
+            self.db_seconds[endpoint] += metrics.db_seconds
+            self.render_seconds[endpoint] += metrics.render_seconds
+            self.commands[endpoint] += metrics.commands
+            self.docs[endpoint] += metrics.docs
+
+
+command_stats = CommandStats()
+endpoint_stats = EndpointStats()
+
+# applies to every MongoClient created from here on; database.py creates its
+# client lazily, on the first query
+monitoring.register(command_stats)
+
+
+def _render_started(sender, template, context, **extra):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.render_started = time.perf_counter()
+
+
+def _render_finished(sender, template, context, **extra):
+    metrics = _current.get()
+    if metrics is not None and metrics.render_started is not None:
+        metrics.render_seconds += time.perf_counter() - metrics.render_started
+        metrics.render_started = None
+
+
+before_render_template.connect(_render_started)
+template_rendered.connect(_render_finished)
+
+
+class StackSampler:
+    """Samples the stacks of in-flight requests from one background thread"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._active = {}
+        self._thread = None
+        self._pid = None
+
+    def begin(self):
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+            self._active[threading.get_ident()] = Counter()
+
+    def end(self):
+        with self._lock:
+            return self._active.pop(threading.get_ident(), None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, stacks in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[_collapse(frame)] += 1
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def _write_profile(endpoint, total, stacks):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f'{time.strftime("%Y%m%d-%H%M%S")}-{endpoint}-{int(total * 1000)}ms-{os.getpid()}.folded'
+    with open(os.path.join(PROFILE_DIR, name), 'w') as f:
+        for stack, samples in stacks.most_common():
+            f.write(f'{stack} {samples}\n')
+
+
+sampler = StackSampler(PROFILE_INTERVAL_MS / 1000) if PROFILE_SLOW_REQUESTS_MS > 0 else None
+
+
+def start_request():
+    _current.set(RequestMetrics())
+    if sampler is not None:
+        sampler.begin()
+
+
+def finish_request(response, endpoint, method):
+    """Record the finished request and add its Server-Timing header"""
+    metrics = _current.get()
+    if metrics is None:
+        return response
+    _current.set(None)
+    total = time.perf_counter() - metrics.started
+    endpoint = endpoint or 'unmatched'
+
+    endpoint_stats.record(endpoint, method, response.status_code, metrics, total)
+    other = max(total - metrics.db_seconds - metrics.render_seconds, 0)
+    response.headers['Server-Timing'] = (
+        f'db;dur={metrics.db_seconds * 1000:.1f};desc="{metrics.commands} queries", '
+        f'render;dur={metrics.render_seconds * 1000:.1f}, '
+        f'app;dur={other * 1000:.1f}, '
+        f'total;dur={total * 1000:.1f}'
+    )
+
+    if sampler is not None:
+        stacks = sampler.end()
+        if stacks and total * 1000 >= PROFILE_SLOW_REQUESTS_MS:
+            _write_profile(endpoint, total, stacks)
+    return response
+
+
+def _labels(**labels):
+    inner = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                     for k, v in labels.items())
+    return '{' + inner + '}' if inner else ''
+
+
+def _family(lines, name, kind, help_text, samples):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {kind}')
+    for labels, value in samples:
+        lines.append(f'{name}{_labels(**labels)} {value}')
+
+
+def render_metrics(pool, hashing):
+    """Prometheus text exposition of everything above plus pool and hashing stats"""
+    lines = []
+    e = endpoint_stats
+    with e._lock:
+        _family(lines, 'fitapply_requests_total', 'counter', 'Requests served',
+                [({'endpoint': ep, 'method': m, 'status': s}, n)
+                 for (ep, m, s), n in sorted(e.requests.items())])
+
+        lines.append('# HELP fitapply_request_duration_seconds Request latency')
+        lines.append('# TYPE fitapply_request_duration_seconds histogram')
+        for ep in sorted(e.count):
+            for bound, n in zip(DURATION_BUCKETS, e.buckets[ep]):
+                lines.append(f'fitapply_request_duration_seconds_bucket{_labels(endpoint=ep, le=bound)} {n}')
+            lines.append(f'fitapply_request_duration_seconds_bucket{_labels(endpoint=ep, le="+Inf")} {e.count[ep]}')
+            lines.append(f'fitapply_request_duration_seconds_sum{_labels(endpoint=ep)} {e.seconds[ep]:.6f}')
+            lines.append(f'fitapply_request_duration_seconds_count{_labels(endpoint=ep)} {e.count[ep]}')
+
+        for name, help_text, values in (
+            ('fitapply_request_db_seconds_total', 'Time spent in MongoDB commands', e.db_seconds),
+            ('fitapply_request_render_seconds_total', 'Time spent rendering templates', e.render_seconds),
+            ('fitapply_request_mongo_commands_total', 'MongoDB commands issued', e.commands),
+            ('fitapply_request_mongo_docs_total', 'Documents returned by MongoDB', e.docs),
+        ):
+            _family(lines, name, 'counter', help_text,
+                    [({'endpoint': ep}, round(v, 6)) for ep, v in sorted(values.items())])
+
+    c = command_stats
+    with c._lock:
+        _family(lines, 'fitapply_mongo_commands_total', 'counter', 'MongoDB commands by name',
+                [({'command': k}, v) for k, v in sorted(c.count.items())])
+        _family(lines, 'fitapply_mongo_command_seconds_total', 'counter', 'MongoDB command time by name',
+                [({'command': k}, round(v, 6)) for k, v in sorted(c.seconds.items())])
+        _family(lines, 'fitapply_mongo_command_failures_total', 'counter', 'Failed MongoDB commands',
+                [({'command': k}, v) for k, v in sorted(c.failures.items())])
+        _family(lines, 'fitapply_mongo_docs_returned_total', 'counter', 'Documents returned by command',
+                [({'command': k}, v) for k, v in sorted(c.docs.items())])
+
+    _family(lines, 'fitapply_mongo_pool_connections', 'gauge', 'Connection pool state',
+            [({'state': k}, pool[k]) for k in ('open', 'checked_out', 'max_checked_out')])
+    _family(lines, 'fitapply_mongo_pool_max_size', 'gauge', 'Configured pool size',
+            [({}, pool['max_pool_size'])])
+    _family(lines, 'fitapply_mongo_pool_events_total', 'counter', 'Connection checkouts and failures',
+            [({'event': k}, pool[k]) for k in ('checkouts', 'checkout_failures', 'wait_timeouts')])
+
+    _family(lines, 'fitapply_password_hash_pending', 'gauge', 'Hashes queued or running',
+            [({}, hashing['pending'])])
+    _family(lines, 'fitapply_password_hashes_total', 'counter', 'Password hashes by outcome',
+            [({'outcome': 'completed'}, hashing['completed']),
+             ({'outcome': 'rejected'}, hashing['rejected'])])
+    for key, name in (('hash_ms', 'fitapply_password_hash_seconds'),
+                      ('queue_wait_ms', 'fitapply_password_hash_queue_wait_seconds')):
+        _family(lines, name, 'summary', 'Recent password hash percentiles',
+                [({'quantile': q}, ms / 1000) for q, ms in
+                 (('0.5', hashing[key]['p50']), ('0.95', hashing[key]['p95']),
+                  ('0.99', hashing[key]['p99'])) if ms is not None])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,246 @@
+"""Job application writes
+
+apply() inserts with a single conditional upsert on (user_id, job_id),
+which the unique user_job_unique index makes race-free: a double-click
+or two concurrent requests produce one application and one
+"already applied" result.
+
+With APPLY_WRITE_BEHIND=1, new applications are queued and written by a
+background thread in insert_many batches of up to APPLY_BATCH_SIZE,
+flushed at least every APPLY_FLUSH_INTERVAL_MS. A hot posting then costs
+the primary one write per batch instead of one per applicant. When the
+queue is full, apply() falls back to the direct upsert. A batch that keeps
+failing is retried with backoff and then written one upsert at a time.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+import counters
+import database
+import events
+
+
+CREATED = 'created'
+QUEUED = 'queued'
+ALREADY_APPLIED = 'already_applied'
+JOB_NOT_FOUND = 'job_not_found'
+
+WRITE_BEHIND = os.environ.get('APPLY_WRITE_BEHIND', '0') == '1'
+BATCH_SIZE = int(os.environ.get('APPLY_BATCH_SIZE', 200))
+FLUSH_INTERVAL = int(os.environ.get('APPLY_FLUSH_INTERVAL_MS', 100)) / 1000
+QUEUE_SIZE = int(os.environ.get('APPLY_QUEUE_SIZE', 10000))
+
+_DUPLICATE_KEY = 11000
+_WRITE_ATTEMPTS = 4
+_RETRY_BACKOFF = 0.25   # seconds, doubled after each failed attempt
+_JOB_PROJECTION = {'title': 1, 'company': 1}
+
+
+def _new_application(job, user_id, cover_letter):
+    return {
+        'user_id': user_id,
+        'job_id': job['_id'],
+        'job_title': job['title'],
+        'company': job['company'],
+        'cover_letter': cover_letter,
+        'applied_at': datetime.utcnow(),
+        'status': 'pending'
+    }
+
+
+def _upsert_args(application):
+    key = {'user_id': application['user_id'], 'job_id': application['job_id']}
+    return key, {'$setOnInsert': application}
+
+
+def _insert_now(applications_col, counters_col, application):
+    try:
+        result = applications_col.update_one(*_upsert_args(application), upsert=True)
+    except DuplicateKeyError:
+        # lost an upsert race against an identical request
+        return ALREADY_APPLIED
+    if result.upserted_id is None:
+        return ALREADY_APPLIED
+
+    counters.record_applications(counters_col, [application])
+    events.publish(events.APPLICATIONS_CHANGED, applications=[application])
+    return CREATED
+
+
+def apply(applications_col, jobs_col, counters_col, user_id, job_id, cover_letter=''):
+    """Submit an application; returns CREATED, QUEUED, ALREADY_APPLIED or JOB_NOT_FOUND"""
+    job = jobs_col.find_one({'_id': job_id}, _JOB_PROJECTION)
+    if job is None:
+        return JOB_NOT_FOUND
+
+    application = _new_application(job, user_id, cover_letter)
+    if WRITE_BEHIND and write_behind.submit(applications_col, counters_col, application):
+        return QUEUED
+    return _insert_now(applications_col, counters_col, application)
+
+
+async def apply_async(applications_col, jobs_col, counters_col, user_id, job_id, cover_letter=''):
+    """apply() for motor collections
+
+    The write-behind queue is fed with synchronous collections, since its
+    writer is an ordinary thread.
+    """
+    job = await jobs_col.find_one({'_id': job_id}, _JOB_PROJECTION)
+    if job is None:
+        return JOB_NOT_FOUND
+
+    application = _new_application(job, user_id, cover_letter)
+    if WRITE_BEHIND and write_behind.submit(database.collection('applications'),
+                                            database.collection('counters'), application):
+        return QUEUED
+    try:
+        result = await applications_col.update_one(*_upsert_args(application), upsert=True)
+    except DuplicateKeyError:
+        return ALREADY_APPLIED
+    if result.upserted_id is None:
+        return ALREADY_APPLIED
+
+    await counters.record_applications_async(counters_col, [application])
+    events.publish(events.APPLICATIONS_CHANGED, applications=[application])
+    return CREATED
+
+
+def _already_written(applications_col, applications):
+    """The applications whose own _id is stored, i.e. written by an earlier attempt"""
+    ids = [a['_id'] for a in applications if '_id' in a]
+    if not ids:
+        return []
+    found = {doc['_id'] for doc in applications_col.find({'_id': {'$in': ids}}, {'_id': 1})}
+    return [a for a in applications if a.get('_id') in found]
+
+
+class WriteBehindQueue:
+    """Background batching of application inserts, one writer thread per process"""
+
+    def __init__(self):
+        self._queue = None
+        self._pid = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._targets = None
+
+    def _start_writer(self):
+        self._thread = threading.Thread(target=self._run, name='apply-write-behind', daemon=True)
+        self._thread.start()
+
+    def _ensure_writer(self):
+        if self._queue is None or self._pid != os.getpid():
+            self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+            self._pid = os.getpid()
+            self._start_writer()
+        elif not self._thread.is_alive():
+            print("✗ Application writer thread died, restarting it")
+            self._start_writer()
+
+    def submit(self, applications_col, counters_col, application):
+        """Queue an application; returns False if the queue is full"""
+        with self._lock:
+            self._ensure_writer()
+            self._targets = (applications_col, counters_col)
+        try:
+            self._queue.put_nowait(application)
+        except queue.Full:
+            return False
+        return True
+
+    def _run(self):
+        pending = self._queue
+        while True:
+            batch = [pending.get()]
+            try:
+                while len(batch) < BATCH_SIZE:
+                    batch.append(pending.get(timeout=FLUSH_INTERVAL))
+            except queue.Empty:
+                pass
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"✗ Application batch of {len(batch)} failed: {e}")
+            finally:
+                for _ in batch:
+                    pending.task_done()
+
+    def _write(self, batch):
+        applications_col, counters_col = self._targets
+        for attempt in range(_WRITE_ATTEMPTS):
+            try:
+                written = self._insert_batch(applications_col, batch)
+                break
+            except PyMongoError as e:
+                print(f"✗ Application batch of {len(batch)} failed (attempt {attempt + 1}): {e}")
+                time.sleep(_RETRY_BACKOFF * 2 ** attempt)
+        else:
+            written = self._insert_each(applications_col, batch)
+
+        if written:
+            try:
+                counters.record_applications(counters_col, written)
+            except PyMongoError as e:
+                print(f"✗ Counters not updated for {len(written)} applications ({e}); "
+                      f"run reconcile-counters")
+            events.publish(events.APPLICATIONS_CHANGED, applications=written)
+
+    def _insert_batch(self, applications_col, batch):
+        """insert_many the batch; returns the applications now stored
+
+        insert_many sets each document's _id, so after a failed attempt a
+        duplicate key error on a retried document can mean it was written the
+        first time; those are told apart from real repeat applications by _id.
+        """
+        try:
+            applications_col.insert_many(batch, ordered=False)
+            return batch
+        except BulkWriteError as e:
+            failed = set()
+            duplicates = []
+            for error in e.details.get('writeErrors', []):
+                failed.add(error['index'])
+                if error.get('code') == _DUPLICATE_KEY:
+                    duplicates.append(batch[error['index']])
+                else:
+                    print(f"✗ Application write failed: {error.get('errmsg')}")
+            written = [a for i, a in enumerate(batch) if i not in failed]
+            return written + _already_written(applications_col, duplicates)
+
+    def _insert_each(self, applications_col, batch):
+        """Last resort for a batch that keeps failing: one upsert per application"""
+        written = []
+        existing = []
+        for application in batch:
+            try:
+                result = applications_col.update_one(*_upsert_args(application), upsert=True)
+            except DuplicateKeyError:
+                existing.append(application)
+                continue
+            except PyMongoError as e:
+                print(f"✗ Application of user {application['user_id']} for job "
+                      f"{application['job_id']} lost: {e}")
+                continue
+            if result.upserted_id is None:
+                existing.append(application)
+            else:
+                written.append(application)
+        return written + _already_written(applications_col, existing)
+
+    def flush(self):
+        """Block until everything queued so far has been written"""
+        with self._lock:
+            if self._queue is None or self._pid != os.getpid():
+                return
+            self._ensure_writer()
+        self._queue.join()
+
+
+write_behind = WriteBehindQueue()
+atexit.register(write_behind.flush)
@@ -0,0 +1,143 @@
+"""Queries behind the /jobs listing"""
+import asyncio
+
+import job_search
+from normalize import EARTH_RADIUS_KM, geocode
+from pagination import decode_cursor, encode_cursor, keyset_page, keyset_page_async
+
+
+PAGE_SIZE = 20
+DEFAULT_RADIUS_KM = 50
+MAX_RADIUS_KM = 500
+
+# sort name -> descending sort key, ending in a unique field; searches are
+# ranked by job_search instead, which also handles 'relevance'
+SORTS = {
+    'newest': ('posted_at', '_id'),
+    'salary': ('salary_max', '_id'),
+    'relevance': None,
+}
+
+# only what the job card renders, plus the sort keys
+CARD_PROJECTION = {'title': 1, 'company': 1, 'location': 1, 'salary': 1, 'category': 1,
+                   'description': 1, 'image': 1, 'posted_at': 1, 'salary_max': 1}
+
+
+def resolve_sort(sort, search):
+    """Pick a valid sort order; relevance only makes sense with a search term"""
+    if sort not in SORTS or (sort == 'relevance' and not search):
+        return 'relevance' if search else 'newest'
+    return sort
+
+
+def _int_arg(args, name, default=0, low=0, high=None):
+    try:
+        value = int(args.get(name, ''))
+    except ValueError:
+        return default
+    value = max(value, low)
+    return min(value, high) if high is not None else value
+
+
+def parse_filters(args):
+    """The listing filters from a request's query args, with bad numbers dropped
+
+    salary_min keeps jobs paying at least that much at the top of their range;
+    salary_max keeps jobs whose range starts at or below it. near names a city
+    (see normalize.GAZETTEER) and radius_km how far from it to look.
+    """
+    return {
+        'category': args.get('category', ''),
+        'location': args.get('location', ''),
+        'work_type': args.get('work_type', ''),
+        'salary_min': _int_arg(args, 'salary_min'),
+        'salary_max': _int_arg(args, 'salary_max'),
+        'near': args.get('near', '').strip(),
+        'radius_km': _int_arg(args, 'radius_km', DEFAULT_RADIUS_KM, 1, MAX_RADIUS_KM),
+    }
+
+
+def _index_filters(filters):
+    """Filters in the form SearchIndex.search takes them"""
+    resolved = dict(filters)
+    resolved['near'] = geocode(filters['near']) if filters['near'] else None
+    return resolved
+
+
+def _search_hits(jobs_col, search, filters, sort, cursor, page_size):
+    """Rank with the in-process search index; returns (index, job ids, next_cursor)"""
+    after = decode_cursor(cursor, 1)
+    offset = after[0] if after and isinstance(after[0], int) and after[0] > 0 else 0
+
+    index = job_search.get_index(jobs_col)
+    total, hits = index.search(search, sort=sort, offset=offset, limit=page_size,
+                               **_index_filters(filters))
+    next_cursor = encode_cursor(offset + page_size) if offset + page_size < total else None
+    return index, [job_id for _, job_id in hits], next_cursor
+
+
+def _search_rows(index, ids, cards, search):
+    rows = []
+    for job_id in ids:
+        job = cards.get(job_id)
+        if job is not None:
+            job['highlights'] = index.highlights(job_id, search)
+            rows.append(job)
+    return rows
+
+
+def _search_page(jobs_col, search, filters, sort, cursor, page_size):
+    """Rank with the in-process search index, then load the page's cards by _id"""
+    index, ids, next_cursor = _search_hits(jobs_col, search, filters, sort, cursor, page_size)
+    cards = {job['_id']: job for job in jobs_col.find({'_id': {'$in': ids}}, CARD_PROJECTION)}
+    return _search_rows(index, ids, cards, search), next_cursor
+
+
+def _listing_query(filters):
+    query = {}
+    if filters['category']:
+        query['category'] = filters['category']
+    if filters['location']:
+        query['location'] = filters['location']
+    if filters['work_type'] == 'remote':
+        query['remote'] = True
+    elif filters['work_type'] == 'onsite':
+        query['remote'] = {'$ne': True}
+    if filters['salary_min']:
+        query['salary_max'] = {'$gte': filters['salary_min']}
+    if filters['salary_max']:
+        query['salary_min'] = {'$gt': 0, '$lte': filters['salary_max']}
+    near = geocode(filters['near']) if filters['near'] else None
+    if near is not None:
+        query['geo'] = {'$geoWithin': {
+            '$centerSphere': [list(near), filters['radius_km'] / EARTH_RADIUS_KM]}}
+    return query
+
+
+def job_page(jobs_col, filters, search='', sort='newest', cursor=None, page_size=PAGE_SIZE):
+    """Return (jobs, next_cursor) for one page of the listing; `filters` come from parse_filters"""
+    if search:
+        return _search_page(jobs_col, search, filters, sort, cursor, page_size)
+
+    return keyset_page(jobs_col, _listing_query(filters), CARD_PROJECTION, SORTS[sort],
+                       cursor=cursor, page_size=page_size)
+
+
+async def job_page_async(jobs_col, async_jobs_col, filters, search='', sort='newest',
+                         cursor=None, page_size=PAGE_SIZE):
+    """job_page reading through motor
+
+    The search index is process-local and still (re)built from the
+    synchronous `jobs_col`, in a worker thread so a build or a long search
+    does not stall the event loop; only the page's documents come from
+    `async_jobs_col`.
+    """
+    if search:
+        index, ids, next_cursor = await asyncio.to_thread(_search_hits, jobs_col, search, filters,
+                                                          sort, cursor, page_size)
+        cards = {job['_id']: job async for job in
+                 async_jobs_col.find({'_id': {'$in': ids}}, CARD_PROJECTION)}
+        return _search_rows(index, ids, cards, search), next_cursor
+
+    return await keyset_page_async(async_jobs_col, _listing_query(filters), CARD_PROJECTION,
+                                   SORTS[sort], cursor=cursor, page_size=page_size)
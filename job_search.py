@@ -0,0 +1,443 @@
+"""In-process job search with prefix and typo-tolerant matching
+
+Jobs are tokenised over title, company and requirements into an inverted
+index. Query terms are expanded against the vocabulary: exact tokens, then
+tokens the term is a prefix of ("pyth" -> "python"), then tokens within one
+or two edits of it ("pyhton" -> "python"). Scores combine the field
+weight of each match with how recently the job was posted.
+
+Expansion is bounded so short or unusual terms stay cheap: a prefix keeps
+its MAX_PREFIX_EXPANSIONS most common completions, and only the
+MAX_FUZZY_CANDIDATES tokens sharing the most trigrams with a term of at
+least MIN_FUZZY_LENGTH characters are checked by edit distance.
+
+Each process keeps its own index. It is built from MongoDB on first use,
+updated incrementally from JOBS_CHANGED events and rebuilt in the
+background after a bulk replace and every SEARCH_INDEX_TTL seconds
+(default 600) to pick up jobs written by other processes.
+"""
+import bisect
+import heapq
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import numpy as np
+from markupsafe import Markup, escape
+
+import events
+from normalize import EARTH_RADIUS_KM
+
+
+SEARCH_INDEX_TTL = int(os.environ.get('SEARCH_INDEX_TTL', 600))
+
+FIELD_WEIGHTS = (('title', 3.0), ('requirements', 2.0), ('company', 1.5))
+PREFIX_WEIGHT = 0.8
+FUZZY_WEIGHT = 0.6
+MAX_PREFIX_EXPANSIONS = 50
+MAX_FUZZY_CANDIDATES = 100
+MIN_FUZZY_LENGTH = 4
+# trigrams shared by more tokens than this are too common to narrow down typo candidates
+MAX_TRIGRAM_TOKENS = 2000
+RECENCY_HALF_LIFE_DAYS = 30.0
+RECENCY_SHARE = 0.25
+
+SNIPPET_LENGTH = 160
+
+_TOKEN = re.compile(r'[a-z0-9][a-z0-9+#]*')
+_WORD = re.compile(r'[A-Za-z0-9][A-Za-z0-9+#]*')
+
+
+def tokenize(text):
+    return _TOKEN.findall((text or '').lower())
+
+
+def trigrams(token):
+    padded = f' {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b):
+    """Levenshtein distance counting a swap of adjacent characters as one edit"""
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def _field_text(job, field):
+    value = job.get(field)
+    if isinstance(value, (list, tuple)):
+        return ' '.join(str(v) for v in value)
+    return value or ''
+
+
+def _snippet(job):
+    """Requirements first, since they are what searches usually match, then the description"""
+    skills = ' · '.join(str(r) for r in job.get('requirements') or [])
+    text = ' — '.join(part for part in (skills, job.get('description') or '') if part)
+    return text[:SNIPPET_LENGTH]
+
+
+def _timestamp(value):
+    return value.timestamp() if isinstance(value, datetime) else 0.0
+
+
+def _grow(array, capacity):
+    grown = np.zeros(capacity, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class SearchIndex:
+    """Inverted index with per-job columns held in NumPy arrays
+
+    Postings map token -> (slots, field weights); each job occupies one slot in
+    the column arrays. Removing a job only clears its `alive` flag, so stale
+    postings are masked out until the next full rebuild.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._size = 0
+        self._job_ids = []          # slot -> job_id
+        self._slots = {}            # job_id -> slot
+        self._titles = []
+        self._snippets = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._posted_ts = np.zeros(0, dtype=np.float64)
+        self._salary_min = np.zeros(0, dtype=np.float64)
+        self._salary_max = np.zeros(0, dtype=np.float64)
+        self._lng = np.zeros(0, dtype=np.float64)       # radians, NaN without a geo point
+        self._lat = np.zeros(0, dtype=np.float64)
+        self._remote = np.zeros(0, dtype=bool)
+        self._category = np.zeros(0, dtype=np.int32)
+        self._location = np.zeros(0, dtype=np.int32)
+        self._codes = {'category': {}, 'location': {}}
+        self._postings = defaultdict(lambda: ([], []))   # token -> (slots, weights)
+        self._frozen = {}           # token -> postings as arrays, dropped on change
+        self._vocabulary = []       # sorted tokens, for prefix lookups
+        self._trigrams = defaultdict(set)    # trigram -> tokens
+        self._doc_freq = Counter()  # token -> postings, to rank prefix completions
+        self._vocabulary_freq = None    # _doc_freq in _vocabulary order, rebuilt when it grows
+        self._expansions = {}       # term -> _expand result, dropped when the vocabulary grows
+        self.built_at = 0.0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _code(self, field, value):
+        codes = self._codes[field]
+        return codes.setdefault(value or '', len(codes) + 1)
+
+    def _ensure_capacity(self):
+        if self._size < len(self._alive):
+            return
+        capacity = max(1024, len(self._alive) * 2)
+        for name in ('_alive', '_posted_ts', '_salary_min', '_salary_max', '_lng', '_lat',
+                     '_remote', '_category', '_location'):
+            setattr(self, name, _grow(getattr(self, name), capacity))
+
+    def add(self, job):
+        """Index a job document, replacing any previous version of it"""
+        tokens = {}
+        for field, weight in FIELD_WEIGHTS:
+            for token in tokenize(_field_text(job, field)):
+                if weight > tokens.get(token, 0):
+                    tokens[token] = weight
+
+        with self._lock:
+            self.remove(job['_id'])
+            self._ensure_capacity()
+            slot = self._size
+            self._size += 1
+            self._job_ids.append(job['_id'])
+            self._slots[job['_id']] = slot
+            self._titles.append(job.get('title', ''))
+            self._snippets.append(_snippet(job))
+            self._alive[slot] = True
+            self._posted_ts[slot] = _timestamp(job.get('posted_at'))
+            self._salary_min[slot] = job.get('salary_min') or 0
+            self._salary_max[slot] = job.get('salary_max') or 0
+            lng, lat = (job.get('geo') or {}).get('coordinates') or (np.nan, np.nan)
+            self._lng[slot] = np.radians(lng)
+            self._lat[slot] = np.radians(lat)
+            self._remote[slot] = bool(job.get('remote'))
+            self._category[slot] = self._code('category', job.get('category'))
+            self._location[slot] = self._code('location', job.get('location'))
+
+            for token, weight in tokens.items():
+                slots, weights = self._postings[token]
+                if not slots:
+                    bisect.insort(self._vocabulary, token)
+                    for gram in trigrams(token):
+                        self._trigrams[gram].add(token)
+                    self._expansions.clear()
+                    self._vocabulary_freq = None
+                self._doc_freq[token] += 1
+                slots.append(slot)
+                weights.append(weight)
+                self._frozen.pop(token, None)
+
+    def remove(self, job_id):
+        with self._lock:
+            slot = self._slots.pop(job_id, None)
+            if slot is not None:
+                self._alive[slot] = False
+
+    def _frozen_postings(self, token):
+        frozen = self._frozen.get(token)
+        if frozen is None:
+            slots, weights = self._postings[token]
+            frozen = (np.array(slots, dtype=np.int32), np.array(weights, dtype=np.float32))
+            self._frozen[token] = frozen
+        return frozen
+
+    def _expand(self, term):
+        """Vocabulary tokens matching `term`, as {token: match weight}"""
+        matches = self._expansions.get(term)
+        if matches is None:
+            if len(self._expansions) >= 4096:
+                self._expansions.clear()
+            matches = self._expansions[term] = self._match(term)
+        return matches
+
+    def _match(self, term):
+        matches = {}
+        if term in self._postings:
+            matches[term] = 1.0
+
+        if len(term) >= 2:
+            start = bisect.bisect_left(self._vocabulary, term)
+            end = bisect.bisect_left(self._vocabulary, term + '\uffff', start)
+            completions = self._vocabulary[start:end]
+            if len(completions) > MAX_PREFIX_EXPANSIONS:
+                if self._vocabulary_freq is None:
+                    self._vocabulary_freq = np.fromiter(
+                        map(self._doc_freq.__getitem__, self._vocabulary),
+                        dtype=np.int64, count=len(self._vocabulary))
+                freq = self._vocabulary_freq[start:end]
+                top = np.argpartition(-freq, MAX_PREFIX_EXPANSIONS - 1)[:MAX_PREFIX_EXPANSIONS]
+                completions = [completions[i] for i in top]
+            for token in completions:
+                if token != term:
+                    matches[token] = PREFIX_WEIGHT
+
+        # typo tolerance only for words that are not in the vocabulary as typed;
+        # trigrams find candidates, edit distance confirms them
+        if len(term) >= MIN_FUZZY_LENGTH and term not in matches:
+            max_distance = 1 if len(term) < 8 else 2
+            grams = trigrams(term)
+            # an edit changes at most four trigrams (a swap of two letters), so
+            # a token sharing fewer cannot be within max_distance; trigrams too
+            # common to help are skipped and lower that bar accordingly
+            min_shared = len(grams) - 4 * max_distance
+            shared = Counter()
+            for gram in grams:
+                tokens = self._trigrams.get(gram, ())
+                if len(tokens) > MAX_TRIGRAM_TOKENS:
+                    min_shared -= 1
+                else:
+                    shared.update(tokens)
+            min_shared = max(1, min_shared)
+            candidates = [token for token, count in shared.items()
+                          if count >= min_shared and token not in matches
+                          and abs(len(token) - len(term)) <= max_distance]
+            if len(candidates) > MAX_FUZZY_CANDIDATES:
+                candidates = heapq.nlargest(MAX_FUZZY_CANDIDATES, candidates, key=shared.__getitem__)
+            for token in candidates:
+                distance = edit_distance(term, token)
+                if distance <= max_distance:
+                    matches[token] = FUZZY_WEIGHT * (1 - distance / len(term))
+        return matches
+
+    def _within(self, n, near, radius_km):
+        """Mask of jobs within `radius_km` of `near` (longitude, latitude), by haversine"""
+        lng, lat = np.radians(near[0]), np.radians(near[1])
+        lats, lngs = self._lat[:n], self._lng[:n]
+        a = (np.sin((lats - lat) / 2) ** 2
+             + np.cos(lat) * np.cos(lats) * np.sin((lngs - lng) / 2) ** 2)
+        with np.errstate(invalid='ignore'):
+            return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a)) <= radius_km
+
+    def search(self, query, category='', location='', work_type='', sort='relevance',
+               offset=0, limit=20, salary_min=0, salary_max=0, near=None, radius_km=0):
+        """Return (total matches, [(score, job_id)] for one page)
+
+        sort is 'relevance', 'newest' or 'salary'; filters mirror the /jobs
+        listing, with `near` already resolved to (longitude, latitude).
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return 0, []
+
+        with self._lock:
+            n = self._size
+            per_term = []
+            for term in terms:
+                term_scores = np.zeros(n, dtype=np.float32)
+                for token, match_weight in self._expand(term).items():
+                    slots, weights = self._frozen_postings(token)
+                    term_scores[slots] = np.maximum(term_scores[slots], weights * match_weight)
+                per_term.append(term_scores)
+            text_score = np.sum(per_term, axis=0)
+
+            mask = self._alive[:n].copy()
+            if category:
+                mask &= self._category[:n] == self._codes['category'].get(category, -1)
+            if location:
+                mask &= self._location[:n] == self._codes['location'].get(location, -1)
+            if work_type == 'remote':
+                mask &= self._remote[:n]
+            elif work_type == 'onsite':
+                mask &= ~self._remote[:n]
+            if salary_min:
+                mask &= self._salary_max[:n] >= salary_min
+            if salary_max:
+                mask &= (self._salary_min[:n] > 0) & (self._salary_min[:n] <= salary_max)
+            if near is not None:
+                mask &= self._within(n, near, radius_km)
+
+            # every term must match; fall back to any term rather than nothing
+            matched = np.flatnonzero(np.logical_and.reduce([t > 0 for t in per_term]) & mask)
+            if not matched.size:
+                matched = np.flatnonzero((text_score > 0) & mask)
+
+            posted = self._posted_ts[matched]
+            age_days = np.maximum(time.time() - posted, 0) / 86400
+            recency = 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+            scores = text_score[matched] * (1 - RECENCY_SHARE + RECENCY_SHARE * recency)
+
+            if sort == 'newest':
+                order = np.lexsort((-scores, -posted))
+            elif sort == 'salary':
+                order = np.lexsort((-scores, -self._salary_max[matched]))
+            else:
+                wanted = offset + limit
+                if wanted < len(scores):
+                    top = np.argpartition(-scores, wanted - 1)[:wanted]
+                    order = top[np.argsort(-scores[top], kind='stable')]
+                else:
+                    order = np.argsort(-scores, kind='stable')
+
+            page = order[offset:offset + limit]
+            return len(matched), [(float(scores[i]), self._job_ids[matched[i]]) for i in page]
+
+    def highlights(self, job_id, query):
+        """Title and snippet with matched words wrapped in <mark>"""
+        with self._lock:
+            slot = self._slots.get(job_id)
+            if slot is None:
+                return None
+            tokens = set()
+            for term in tokenize(query):
+                tokens.update(self._expand(term))
+            title, snippet = self._titles[slot], self._snippets[slot]
+        return {'title': highlight(title, tokens), 'snippet': highlight(snippet, tokens)}
+
+
+def highlight(text, tokens):
+    """Escape `text` and wrap every word whose token is in `tokens` in <mark>"""
+    parts = []
+    last = 0
+    for match in _WORD.finditer(text):
+        if match.group().lower() in tokens:
+            parts.append(escape(text[last:match.start()]))
+            parts.append(Markup('<mark>%s</mark>') % match.group())
+            last = match.end()
+    parts.append(escape(text[last:]))
+    return Markup('').join(parts)
+
+
+_INDEX_PROJECTION = {'title': 1, 'company': 1, 'requirements': 1, 'description': 1,
+                     'posted_at': 1, 'salary_min': 1, 'salary_max': 1, 'category': 1,
+                     'location': 1, 'remote': 1, 'geo': 1}
+
+_index = None
+_index_lock = threading.Lock()
+_rebuilding = False
+_stale = False      # a replace made the index out of date; rebuild without waiting for the TTL
+# bumped by JOBS_CHANGED events that replace jobs; an index built from a scan
+# that started before the latest bump may predate the replace and is discarded
+_generation = 0
+_added_during_rebuild = []     # replayed into the rebuilt index, which may have missed them
+
+
+def build_index(jobs_col):
+    index = SearchIndex()
+    for job in jobs_col.find({}, _INDEX_PROJECTION).batch_size(1000):
+        index.add(job)
+    index.built_at = time.monotonic()
+    return index
+
+
+def _rebuild_in_background(jobs_col):
+    """Start a rebuild; the caller holds _index_lock"""
+    global _rebuilding
+    generation = _generation
+    del _added_during_rebuild[:]
+
+    def run():
+        global _index, _rebuilding, _stale
+        try:
+            index = build_index(jobs_col)
+            with _index_lock:
+                if _generation == generation:
+                    for job in _added_during_rebuild:
+                        index.add(job)
+                    _index = index
+                    _stale = False
+        finally:
+            with _index_lock:
+                _rebuilding = False
+                del _added_during_rebuild[:]
+
+    _rebuilding = True
+    threading.Thread(target=run, name='search-index-rebuild', daemon=True).start()
+
+
+def get_index(jobs_col):
+    """The process-wide index, built on first use and refreshed in the background
+
+    After a replace or once SEARCH_INDEX_TTL has passed, the current index
+    keeps serving while its replacement is built.
+    """
+    global _index
+    index = _index
+    if index is None:
+        with _index_lock:
+            if _index is None:
+                _index = build_index(jobs_col)
+            index = _index
+    elif not _rebuilding and (_stale or time.monotonic() - index.built_at > SEARCH_INDEX_TTL):
+        with _index_lock:
+            if not _rebuilding:
+                _rebuild_in_background(jobs_col)
+    return index
+
+
+def _on_jobs_changed(jobs=None, replaced=False, **_):
+    global _generation, _stale
+    with _index_lock:
+        if replaced or jobs is None:
+            _generation += 1
+            _stale = True
+            return
+        if _index is not None:
+            for job in jobs:
+                _index.add(job)
+        if _rebuilding:
+            _added_during_rebuild.extend(jobs)
+
+
+events.subscribe(events.JOBS_CHANGED, _on_jobs_changed)
@@ -0,0 +1,230 @@
+"""Push application status changes to the applicants' open dashboards
+
+One watcher thread per process follows status changes on the applications
+collection and fans them out to every connected client of the affected
+user, so the number of open dashboards does not change the load on MongoDB.
+
+Changes come from a change stream where the server supports one (replica
+sets and sharded clusters). Otherwise, or with LIVE_UPDATES=poll, the
+watcher polls the status_changed_at field every LIVE_POLL_INTERVAL seconds,
+and only while someone is connected.
+
+Under WSGI each open stream holds a worker thread, so stream() ends after
+LIVE_STREAM_SECONDS and the browser's EventSource reconnects a second
+later; set it to 0 on servers with a thread or greenlet per connection.
+stream_async() has no such limit.
+"""
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+
+import database
+import dashboard_data
+
+
+LIVE_UPDATES = os.environ.get('LIVE_UPDATES', 'auto')      # auto, changestream or poll
+LIVE_POLL_INTERVAL = float(os.environ.get('LIVE_POLL_INTERVAL', 2))
+LIVE_HEARTBEAT = float(os.environ.get('LIVE_HEARTBEAT', 15))
+LIVE_STREAM_SECONDS = float(os.environ.get('LIVE_STREAM_SECONDS', 30))
+
+_RETRY_DELAY = 5
+_RECONNECT_DELAY = 1    # after a stream closed on purpose, seconds
+_CLIENT_BACKLOG = 100
+
+_CHANGE_PIPELINE = [
+    {'$match': {'operationType': 'update',
+                'updateDescription.updatedFields.status': {'$exists': True}}},
+    {'$project': {'fullDocument._id': 1, 'fullDocument.user_id': 1, 'fullDocument.status': 1}},
+]
+_POLL_PROJECTION = {'user_id': 1, 'status': 1, 'status_changed_at': 1}
+
+
+class StatusWatcher:
+    """Single source of status changes, fanned out to per-user callbacks"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)    # user_id -> callbacks
+        self._pid = None
+        self._resume_token = None
+        self.mode = None
+
+    def subscribe(self, user_id, callback):
+        """Call callback(delta) from the watcher thread for each of the user's status changes"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._subscribers.clear()
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name='live-updates', daemon=True).start()
+            self._subscribers[user_id].add(callback)
+
+    def unsubscribe(self, user_id, callback):
+        with self._lock:
+            callbacks = self._subscribers.get(user_id)
+            if callbacks is not None:
+                callbacks.discard(callback)
+                if not callbacks:
+                    del self._subscribers[user_id]
+
+    def connected(self):
+        with self._lock:
+            return sum(len(callbacks) for callbacks in self._subscribers.values())
+
+    def _run(self):
+        use_stream = LIVE_UPDATES == 'changestream' or (
+            LIVE_UPDATES == 'auto' and not database.MONGO_URI.startswith('mongomock://'))
+        while use_stream:
+            try:
+                self.mode = 'changestream'
+                self._watch()
+            except OperationFailure as e:
+                if self._resume_token is None and LIVE_UPDATES == 'auto':
+                    print(f"✓ Change streams unavailable ({e}), polling for status changes")
+                    break
+                print(f"✗ Status change stream failed: {e}")
+                time.sleep(_RETRY_DELAY)
+            except PyMongoError as e:
+                print(f"✗ Status change stream failed: {e}")
+                time.sleep(_RETRY_DELAY)
+        self.mode = 'poll'
+        self._poll()
+
+    def _watch(self):
+        applications_col = database.collection('applications')
+        with applications_col.watch(_CHANGE_PIPELINE, full_document='updateLookup',
+                                    resume_after=self._resume_token) as stream:
+            for change in stream:
+                self._resume_token = stream.resume_token
+                if change.get('fullDocument'):
+                    self._deliver([change['fullDocument']])
+
+    def _poll(self):
+        applications_col = database.collection('applications')
+        since = datetime.utcnow()
+        # a bulk update stamps many applications with one time, and a poll can
+        # land halfway through it; remember who was already seen at `since`
+        seen = set()
+        while True:
+            time.sleep(LIVE_POLL_INTERVAL)
+            if not self.connected():
+                since, seen = datetime.utcnow(), set()
+                continue
+            try:
+                found = list(applications_col.find({'status_changed_at': {'$gte': since}},
+                                                   _POLL_PROJECTION)
+                             .sort('status_changed_at', ASCENDING))
+            except PyMongoError as e:
+                print(f"✗ Status change poll failed: {e}")
+                continue
+            changed = [a for a in found
+                       if a['status_changed_at'] > since or a['_id'] not in seen]
+            if changed:
+                latest = changed[-1]['status_changed_at']
+                if latest > since:
+                    since, seen = latest, set()
+                seen.update(a['_id'] for a in changed if a['status_changed_at'] == since)
+                self._deliver(changed)
+
+    def _deliver(self, applications):
+        by_user = defaultdict(list)
+        with self._lock:
+            for application in applications:
+                callbacks = self._subscribers.get(application['user_id'])
+                if callbacks:
+                    by_user[application['user_id']].append(application)
+
+        # counted from the applications themselves: the status change reaches
+        # us before its writer has updated the user's counters document
+        applications_col = database.collection('applications')
+        for user_id, changed in by_user.items():
+            try:
+                counts = dashboard_data.status_counts(applications_col, user_id)
+            except PyMongoError:
+                counts = None
+            with self._lock:
+                callbacks = list(self._subscribers.get(user_id, ()))
+            for application in changed:
+                delta = {'application_id': str(application['_id']),
+                         'status': application['status'],
+                         'counts': counts}
+                for callback in callbacks:
+                    callback(delta)
+
+
+watcher = StatusWatcher()
+
+
+def _event(delta):
+    return f'event: status\ndata: {json.dumps(delta)}\n\n'
+
+
+def stream(user_id, max_seconds=LIVE_STREAM_SECONDS):
+    """Server-sent events for one open dashboard
+
+    Runs until the client goes away or, when max_seconds is set, until
+    that much time has passed; the client then reconnects.
+    """
+    pending = queue.Queue(maxsize=_CLIENT_BACKLOG)
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+
+    def deliver(delta):
+        try:
+            pending.put_nowait(delta)
+        except queue.Full:
+            pass
+
+    watcher.subscribe(user_id, deliver)
+    try:
+        yield f'retry: {(_RECONNECT_DELAY if deadline else _RETRY_DELAY) * 1000}\n\n'
+        while True:
+            timeout = LIVE_HEARTBEAT
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 0:
+                    return
+            try:
+                delta = pending.get(timeout=timeout)
+            except queue.Empty:
+                # also how a closed connection is noticed
+                yield ': keepalive\n\n'
+                continue
+            yield _event(delta)
+    finally:
+        watcher.unsubscribe(user_id, deliver)
+
+
+async def stream_async(user_id):
+    """stream() for the ASGI entry point, without holding a thread per client"""
+    loop = asyncio.get_running_loop()
+    pending = asyncio.Queue(maxsize=_CLIENT_BACKLOG)
+
+    def put(delta):
+        if not pending.full():
+            pending.put_nowait(delta)
+
+    def deliver(delta):
+        try:
+            loop.call_soon_threadsafe(put, delta)
+        except RuntimeError:
+            pass    # the event loop has shut down; unsubscribed shortly
+
+    watcher.subscribe(user_id, deliver)
+    try:
+        yield f'retry: {_RETRY_DELAY * 1000}\n\n'
+        while True:
+            try:
+                delta = await asyncio.wait_for(pending.get(), LIVE_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            yield _event(delta)
+    finally:
+        watcher.unsubscribe(user_id, deliver)
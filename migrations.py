@@ -0,0 +1,55 @@
+"""One-off data migrations, run from the Flask CLI"""
+from pymongo import ASCENDING, UpdateOne
+
+import events
+from normalize import derived_fields
+
+
+BATCH_SIZE = 1000
+
+_DERIVED_PROJECTION = {'salary': 1, 'location': 1, 'salary_min': 1, 'salary_max': 1,
+                       'remote': 1, 'geo': 1}
+
+
+def backfill_job_fields(jobs_col, batch_size=BATCH_SIZE, query=None):
+    """Recompute every job's derived salary, remote and geo fields
+
+    Walks the collection in _id order one batch at a time, so it can run
+    against a live database and be stopped and restarted safely. Only jobs
+    whose stored values differ are written; `query` limits the jobs looked
+    at. Yields (scanned, updated) per batch.
+    """
+    last_id = None
+    while True:
+        clauses = [query or {}]
+        if last_id is not None:
+            clauses.append({'_id': {'$gt': last_id}})
+        batch = list(jobs_col.find({'$and': clauses}, _DERIVED_PROJECTION)
+                     .sort('_id', ASCENDING).limit(batch_size))
+        if not batch:
+            return
+
+        ops = []
+        for job in batch:
+            fields = derived_fields(job)
+            if any(job.get(name) != value for name, value in fields.items()):
+                ops.append(UpdateOne({'_id': job['_id']}, {'$set': fields}))
+        if ops:
+            jobs_col.bulk_write(ops, ordered=False)
+
+        last_id = batch[-1]['_id']
+        yield len(batch), len(ops)
+
+
+# jobs stored before salary_min/salary_max existed; served by the salary_max index
+LEGACY_JOBS = {'salary_max': {'$exists': False}}
+
+
+def backfill_legacy_jobs(jobs_col):
+    """Run backfill_job_fields over LEGACY_JOBS; returns the number of jobs updated"""
+    if jobs_col.find_one(LEGACY_JOBS, {'_id': 1}) is None:
+        return 0
+    updated = sum(n for _, n in backfill_job_fields(jobs_col, query=LEGACY_JOBS))
+    if updated:
+        events.publish(events.JOBS_CHANGED, replaced=True)
+    return updated
@@ -0,0 +1,129 @@
+"""Normalise free-text job fields into indexable values"""
+import re
+
+
+EARTH_RADIUS_KM = 6378.1
+
+# city -> (longitude, latitude); matched on 'City, ST' or the city alone
+GAZETTEER = {
+    'New York, NY': (-74.006, 40.7128),
+    'Brooklyn, NY': (-73.9442, 40.6782),
+    'Boston, MA': (-71.0589, 42.3601),
+    'Philadelphia, PA': (-75.1652, 39.9526),
+    'Washington, DC': (-77.0369, 38.9072),
+    'Baltimore, MD': (-76.6122, 39.2904),
+    'Pittsburgh, PA': (-79.9959, 40.4406),
+    'Atlanta, GA': (-84.388, 33.749),
+    'Miami, FL': (-80.1918, 25.7617),
+    'Orlando, FL': (-81.3792, 28.5383),
+    'Tampa, FL': (-82.4572, 27.9506),
+    'Charlotte, NC': (-80.8431, 35.2271),
+    'Raleigh, NC': (-78.6382, 35.7796),
+    'Nashville, TN': (-86.7816, 36.1627),
+    'Chicago, IL': (-87.6298, 41.8781),
+    'Detroit, MI': (-83.0458, 42.3314),
+    'Minneapolis, MN': (-93.265, 44.9778),
+    'Columbus, OH': (-82.9988, 39.9612),
+    'Indianapolis, IN': (-86.1581, 39.7684),
+    'St. Louis, MO': (-90.1994, 38.627),
+    'Kansas City, MO': (-94.5786, 39.0997),
+    'Dallas, TX': (-96.797, 32.7767),
+    'Houston, TX': (-95.3698, 29.7604),
+    'Austin, TX': (-97.7431, 30.2672),
+    'San Antonio, TX': (-98.4936, 29.4241),
+    'Denver, CO': (-104.9903, 39.7392),
+    'Boulder, CO': (-105.2705, 40.015),
+    'Salt Lake City, UT': (-111.891, 40.7608),
+    'Phoenix, AZ': (-112.074, 33.4484),
+    'Las Vegas, NV': (-115.1398, 36.1699),
+    'Los Angeles, CA': (-118.2437, 34.0522),
+    'San Diego, CA': (-117.1611, 32.7157),
+    'Irvine, CA': (-117.8265, 33.6846),
+    'San Francisco, CA': (-122.4194, 37.7749),
+    'Oakland, CA': (-122.2712, 37.8044),
+    'San Jose, CA': (-121.8863, 37.3382),
+    'Palo Alto, CA': (-122.143, 37.4419),
+    'Mountain View, CA': (-122.0838, 37.3861),
+    'Sacramento, CA': (-121.4944, 38.5816),
+    'Portland, OR': (-122.6765, 45.5231),
+    'Seattle, WA': (-122.3321, 47.6062),
+    'Bellevue, WA': (-122.2015, 47.6101),
+    'Toronto, ON': (-79.3832, 43.6532),
+    'Vancouver, BC': (-123.1207, 49.2827),
+    'Montreal, QC': (-73.5673, 45.5017),
+    'London, UK': (-0.1276, 51.5072),
+    'Dublin, Ireland': (-6.2603, 53.3498),
+    'Berlin, Germany': (13.405, 52.52),
+    'Amsterdam, Netherlands': (4.9041, 52.3676),
+    'Paris, France': (2.3522, 48.8566),
+    'Bangalore, India': (77.5946, 12.9716),
+    'Chennai, India': (80.2707, 13.0827),
+    'Hyderabad, India': (78.4867, 17.385),
+    'Pune, India': (73.8567, 18.5204),
+    'Mumbai, India': (72.8777, 19.076),
+    'Singapore': (103.8198, 1.3521),
+    'Sydney, Australia': (151.2093, -33.8688),
+}
+
+_PLACES = {}
+for _name, _coords in GAZETTEER.items():
+    _PLACES[_name.lower()] = _coords
+    _PLACES.setdefault(_name.split(',')[0].lower(), _coords)
+
+
+_AMOUNT = re.compile(r'\$?\s*(\d[\d,]*(?:\.\d+)?)\s*([kK])?')
+
+
+def parse_salary(text):
+    """Parse '$120,000 - $160,000' style salaries into (min, max) integers
+
+    A single figure gives min == max; text without figures gives (0, 0), so
+    every job saved through normalize_job has both fields. Jobs stored before
+    they were introduced lack them until `flask backfill-jobs` runs, which
+    bootstrap starts automatically when it finds such jobs.
+    """
+    amounts = []
+    for number, thousands in _AMOUNT.findall(text or ''):
+        value = float(number.replace(',', ''))
+        if thousands:
+            value *= 1000
+        amounts.append(int(value))
+    if not amounts:
+        return 0, 0
+    return min(amounts), max(amounts)
+
+
+def is_remote(location):
+    """True for locations such as 'Remote' or 'Remote (US)'"""
+    return 'remote' in (location or '').lower()
+
+
+def geocode(location):
+    """(longitude, latitude) of a known city such as 'Seattle, WA', else None"""
+    key = (location or '').strip().lower()
+    if not key or 'remote' in key:
+        return None
+    return _PLACES.get(key) or _PLACES.get(key.split(',')[0].strip())
+
+
+def geo_point(location):
+    """GeoJSON point for a 2dsphere index, or None (which the index skips)"""
+    coords = geocode(location)
+    return {'type': 'Point', 'coordinates': list(coords)} if coords else None
+
+
+def derived_fields(job):
+    """The indexable fields computed from a job's free text"""
+    salary_min, salary_max = parse_salary(job.get('salary'))
+    return {
+        'salary_min': salary_min,
+        'salary_max': salary_max,
+        'remote': is_remote(job.get('location')),
+        'geo': geo_point(job.get('location')),
+    }
+
+
+def normalize_job(job):
+    """Add the derived fields to a job document in place"""
+    job.update(derived_fields(job))
+    return job
@@ -0,0 +1,194 @@
+"""Whole-page cache for anonymous GET requests
+
+Entries are keyed on the route path, the sorted query args and the current
+version of every tag the page depends on. Publishing a change event bumps
+the tag version, which makes every older entry unreachable at once; stale
+entries then age out of the LRU or expire in Redis.
+
+Configure with PAGE_CACHE_BACKEND = memory (default) | redis | none,
+PAGE_CACHE_SIZE, PAGE_CACHE_TTL and PAGE_CACHE_REDIS_URL. The redis backend
+needs the optional redis package (requirements-redis.txt).
+"""
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import quote, urlencode
+
+from flask import Response, make_response, request, session
+
+import events
+
+
+class MemoryBackend:
+    """Process-local LRU store"""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def version(self, tag):
+        return self._versions.get(tag, 0)
+
+    def bump(self, tag):
+        with self._lock:
+            self._versions[tag] = self._versions.get(tag, 0) + 1
+
+
+class RedisBackend:
+    """Store shared by every worker through a local Redis-compatible server"""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('PAGE_CACHE_BACKEND=redis needs the redis package: '
+                               'pip install -r requirements-redis.txt') from None
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self._redis.get(key)
+
+    def set(self, key, value, ttl):
+        self._redis.set(key, value, ex=ttl)
+
+    def version(self, tag):
+        return int(self._redis.get(f'page-tag:{tag}') or 0)
+
+    def bump(self, tag):
+        self._redis.incr(f'page-tag:{tag}')
+
+
+def _backend_from_env():
+    kind = os.environ.get('PAGE_CACHE_BACKEND', 'memory')
+    if kind == 'none':
+        return None
+    if kind == 'redis':
+        return RedisBackend(os.environ.get('PAGE_CACHE_REDIS_URL', 'redis://localhost:6379/0'))
+    return MemoryBackend(int(os.environ.get('PAGE_CACHE_SIZE', 512)))
+
+
+backend = _backend_from_env()
+DEFAULT_TTL = int(os.environ.get('PAGE_CACHE_TTL', 300))
+
+
+def _pack(body, mimetype, etag, last_modified):
+    meta = json.dumps({'mimetype': mimetype, 'etag': etag, 'last_modified': last_modified})
+    return meta.encode() + b'\n' + body
+
+
+def _unpack(value):
+    meta, body = value.split(b'\n', 1)
+    return json.loads(meta), body
+
+
+def _cache_key(tags):
+    # path and args are re-escaped, so a '&', '=' or '?' inside a value cannot
+    # make two different requests share a key
+    versions = ','.join(f'{tag}={backend.version(tag)}' for tag in tags)
+    args = urlencode(sorted(request.args.items(multi=True)))
+    return f'page:{versions}:{quote(request.path)}?{args}'
+
+
+def _cacheable_request():
+    """Only anonymous visitors with nothing pending in their session share pages"""
+    return (backend is not None and request.method == 'GET'
+            and 'user_id' not in session and '_flashes' not in session)
+
+
+def _conditional(body, mimetype, etag, last_modified):
+    response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response.make_conditional(request)
+
+
+def _cached_response(key):
+    hit = backend.get(key)
+    if hit is None:
+        return None
+    meta, body = _unpack(hit)
+    return _conditional(body, meta['mimetype'], meta['etag'], meta['last_modified'])
+
+
+def _store(key, rv, ttl):
+    response = make_response(rv)
+    if response.status_code != 200 or response.direct_passthrough:
+        return response
+
+    body = response.get_data()
+    etag = hashlib.md5(body).hexdigest()
+    last_modified = int(time.time())
+    backend.set(key, _pack(body, response.mimetype, etag, last_modified), ttl or DEFAULT_TTL)
+    return _conditional(body, response.mimetype, etag, last_modified)
+
+
+def cached_page(tags=(), ttl=None):
+    """Cache a view's rendered page for anonymous visitors
+
+    `tags` name the data the page depends on (see invalidate); responses carry
+    an ETag and Last-Modified so repeat visits revalidate with a 304. Works on
+    plain and `async def` views.
+    """
+    def decorator(view):
+        if inspect.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(*args, **kwargs):
+                if not _cacheable_request():
+                    return await view(*args, **kwargs)
+                key = _cache_key(tags)
+                hit = _cached_response(key)
+                if hit is not None:
+                    return hit
+                return _store(key, await view(*args, **kwargs), ttl)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not _cacheable_request():
+                return view(*args, **kwargs)
+            key = _cache_key(tags)
+            hit = _cached_response(key)
+            if hit is not None:
+                return hit
+            return _store(key, view(*args, **kwargs), ttl)
+        return wrapper
+    return decorator
+
+
+def invalidate(tag):
+    """Make every cached page tagged with `tag` stale"""
+    if backend is not None:
+        backend.bump(tag)
+
+
+events.subscribe(events.JOBS_CHANGED, lambda **_: invalidate('jobs'))
+events.subscribe(events.USERS_CHANGED, lambda **_: invalidate('users'))
+events.subscribe(events.APPLICATIONS_CHANGED, lambda **_: invalidate('applications'))
@@ -0,0 +1,128 @@
+"""Opaque keyset-pagination tokens"""
+import base64
+import json
+import math
+from datetime import datetime
+
+from bson.objectid import ObjectId
+
+
+def _encode_value(value):
+    if isinstance(value, ObjectId):
+        return {'$oid': str(value)}
+    if isinstance(value, datetime):
+        return {'$date': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    """Inverse of _encode_value; raises ValueError for anything it cannot produce
+
+    Cursors come from the query string, so a dict that is not exactly one
+    $oid or $date (e.g. a query operator) or a list never reaches a filter.
+    """
+    if value is None or isinstance(value, (str, bool, int)):
+        return value
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            raise ValueError('non-finite cursor value')
+        return value
+    if isinstance(value, dict) and len(value) == 1:
+        (key, raw), = value.items()
+        if key == '$oid' and isinstance(raw, str) and ObjectId.is_valid(raw):
+            return ObjectId(raw)
+        if key == '$date' and isinstance(raw, str):
+            return datetime.fromisoformat(raw)
+    raise ValueError('unsupported cursor value')
+
+
+def encode_cursor(*values):
+    """Pack the sort-key values of the last row on a page into a URL-safe token"""
+    raw = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, size):
+    """Unpack a token from encode_cursor; returns None if it is missing or malformed"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list):
+            return None
+        values = [_decode_value(v) for v in values]
+    except (ValueError, TypeError):
+        return None
+    if len(values) != size:
+        return None
+    return values
+
+
+def _after(field, value, direction):
+    """Filter for `field` strictly after `value`; None when no value sorts after it
+
+    MongoDB sorts null and missing values before every number, string or
+    date, so they come last in a descending sort and first in an ascending one.
+    """
+    if value is None:
+        return None if direction < 0 else {field: {'$ne': None}}
+    if direction < 0:
+        return {'$or': [{field: {'$lt': value}}, {field: None}]}
+    return {field: {'$gt': value}}
+
+
+def keyset_after(fields, values, direction=-1):
+    """Build the filter selecting rows strictly after `values` in a compound sort
+
+    `fields` is the sort key in order (the last one must be unique, normally
+    _id) and `direction` the shared sort direction, -1 for descending.
+    A None value stands for a null or missing field.
+    """
+    clauses = []
+    for i, field in enumerate(fields):
+        after = _after(field, values[i], direction)
+        if after is None:
+            continue
+        clause = {f: values[j] for j, f in enumerate(fields[:i])}
+        if field in after:
+            clause.update(after)
+        else:
+            clause = {'$and': [clause, after]} if clause else after
+        clauses.append(clause)
+    return {'$or': clauses} if clauses else {'_id': {'$exists': False}}
+
+
+def _keyset_query(query, sort_fields, cursor):
+    after = decode_cursor(cursor, len(sort_fields))
+    if after is None:
+        return query
+    keyset = keyset_after(sort_fields, after)
+    return {'$and': [query, keyset]} if query else keyset
+
+
+def _finish_page(rows, sort_fields, page_size):
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(*(rows[-1].get(f) for f in sort_fields))
+    return rows, next_cursor
+
+
+def keyset_page(col, query, projection, sort_fields, cursor=None, page_size=20):
+    """Fetch one page of `col` sorted descending on `sort_fields`
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    rows = list(col.find(_keyset_query(query, sort_fields, cursor), projection)
+                .sort([(f, -1) for f in sort_fields])
+                .limit(page_size + 1))
+    return _finish_page(rows, sort_fields, page_size)
+
+
+async def keyset_page_async(col, query, projection, sort_fields, cursor=None, page_size=20):
+    """keyset_page for a motor collection"""
+    rows = await (col.find(_keyset_query(query, sort_fields, cursor), projection)
+                  .sort([(f, -1) for f in sort_fields])
+                  .to_list(page_size + 1))
+    return _finish_page(rows, sort_fields, page_size)
@@ -0,0 +1,202 @@
+"""Password hashing off the request thread
+
+Hashes are computed in a small process pool so a burst of logins cannot
+starve every other route of CPU. At most PASSWORD_HASH_MAX_PENDING hashes
+may be queued or running per web worker; beyond that callers get
+HashingBusy immediately instead of waiting behind the queue.
+
+    PASSWORD_HASH_METHOD       werkzeug method, e.g. pbkdf2:sha256:600000 or scrypt
+    PASSWORD_HASH_WORKERS      processes in the pool (0 hashes inline)
+    PASSWORD_HASH_MAX_PENDING  queue-depth limit
+    PASSWORD_HASH_TIMEOUT      seconds to wait for a result
+
+Workers are started from a forkserver (spawn where that is unavailable)
+rather than forked from the web worker, so they never inherit its threads,
+locks or open sockets. A pool broken by a dead worker is replaced.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 32))
+HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+
+_SAMPLES = 1024
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full or a hash takes too long"""
+
+
+def _timed(func, *args):
+    """Runs in the pool: returns (result, wall-clock start, seconds spent hashing)"""
+    started = time.time()
+    result = func(*args)
+    return result, started, time.time() - started
+
+
+class HashStats:
+    """Recent hash latency and queue wait samples for the current process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hash_seconds = deque(maxlen=_SAMPLES)
+        self.wait_seconds = deque(maxlen=_SAMPLES)
+        self.completed = 0
+        self.rejected = 0
+        self.pending = 0
+
+    def adjust_pending(self, delta):
+        with self._lock:
+            self.pending += delta
+
+    def record_rejected(self):
+        with self._lock:
+            self.rejected += 1
+
+    def record(self, wait, duration):
+        with self._lock:
+            self.wait_seconds.append(wait)
+            self.hash_seconds.append(duration)
+            self.completed += 1
+
+    @staticmethod
+    def _percentiles(samples):
+        ordered = sorted(samples)
+        if not ordered:
+            return {'p50': None, 'p95': None, 'p99': None}
+        pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+        return {'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99)}
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'method': HASH_METHOD,
+                'workers': HASH_WORKERS,
+                'pending': self.pending,
+                'max_pending': MAX_PENDING,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'hash_ms': self._percentiles(self.hash_seconds),
+                'queue_wait_ms': self._percentiles(self.wait_seconds),
+            }
+
+
+stats = HashStats()
+
+_slots = threading.BoundedSemaphore(MAX_PENDING)
+_pool_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+_current_method = None
+
+
+def _start_method():
+    methods = multiprocessing.get_all_start_methods()
+    return 'forkserver' if 'forkserver' in methods else 'spawn'
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    pid = os.getpid()
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            _pool = ProcessPoolExecutor(max_workers=HASH_WORKERS,
+                                        mp_context=multiprocessing.get_context(_start_method()))
+            _pool_pid = pid
+        return _pool
+
+
+def _discard_pool(pool):
+    """Drop a pool broken by a dead worker so the next hash starts a fresh one"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _acquire():
+    if not _slots.acquire(blocking=False):
+        stats.record_rejected()
+        raise HashingBusy('Too many password hashes pending')
+    stats.adjust_pending(1)
+
+
+def _release(_future=None):
+    stats.adjust_pending(-1)
+    _slots.release()
+
+
+def _run(func, *args):
+    if HASH_WORKERS <= 0:
+        _acquire()
+        submitted = time.time()
+        try:
+            result, started, duration = _timed(func, *args)
+        finally:
+            _release()
+        stats.record(max(started - submitted, 0), duration)
+        return result
+
+    # a worker killed mid-hash (OOM, segfault) breaks the whole pool; replace
+    # it and try once more before giving up
+    for _attempt in range(2):
+        _acquire()
+        pool = _get_pool()
+        submitted = time.time()
+        try:
+            future = pool.submit(_timed, func, *args)
+        except BrokenProcessPool:
+            _release()
+            _discard_pool(pool)
+            continue
+        except BaseException:
+            _release()
+            raise
+        # a hash we stop waiting for keeps its pool worker busy, so its slot is
+        # only given back once it has finished (or been cancelled while queued)
+        future.add_done_callback(_release)
+        try:
+            result, started, duration = future.result(timeout=HASH_TIMEOUT)
+        except TimeoutError:
+            future.cancel()
+            raise HashingBusy('Password hashing timed out')
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            continue
+        stats.record(max(started - submitted, 0), duration)
+        return result
+    raise HashingBusy('Password hashing pool keeps failing')
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, HASH_METHOD)
+
+
+def verify_password(pwhash, password):
+    return _run(check_password_hash, pwhash, password)
+
+
+def current_method():
+    """The full method string new hashes get, e.g. 'scrypt:32768:8:1'"""
+    global _current_method
+    if _current_method is None:
+        # werkzeug fills in default parameters, so hash once to learn them
+        sample = generate_password_hash('', HASH_METHOD, salt_length=1)
+        _current_method = sample.split('$', 1)[0]
+    return _current_method
+
+
+def needs_rehash(pwhash):
+    """True when `pwhash` was made with different hashing parameters"""
+    return pwhash.split('$', 1)[0] != current_method()
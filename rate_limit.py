@@ -0,0 +1,49 @@
+"""Sliding-window rate limiting for login and signup attempts"""
+import os
+import threading
+import time
+from collections import deque
+
+
+class RateLimiter:
+    """Allow at most `limit` hits per key within `window` seconds, per process"""
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self._hits = {}
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + window
+
+    def hit(self, key):
+        """Record an attempt for `key`; returns False if it is over the limit"""
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            hits = self._hits.setdefault(key, deque())
+            while hits and hits[0] <= now - self.window:
+                hits.popleft()
+            if len(hits) >= self.limit:
+                return False
+            hits.append(now)
+            return True
+
+    def _sweep(self, now):
+        """Forget keys with no recent hits so memory stays bounded"""
+        cutoff = now - self.window
+        for key in [k for k, hits in self._hits.items() if not hits or hits[-1] <= cutoff]:
+            del self._hits[key]
+        self._next_sweep = now + self.window
+
+
+auth_by_ip = RateLimiter(int(os.environ.get('AUTH_RATE_LIMIT_PER_IP', 20)), 60)
+auth_by_email = RateLimiter(int(os.environ.get('AUTH_RATE_LIMIT_PER_EMAIL', 5)), 60)
+
+
+def allow_auth_attempt(ip, email):
+    """Throttle password checks per client IP and per account email"""
+    allowed = auth_by_ip.hit(ip)
+    if email:
+        allowed = auth_by_email.hit(email.lower()) and allowed
+    return allowed
@@ -0,0 +1,303 @@
+"""Skill-based job recommendations
+
+Skills come from job requirements ("Python 3.9+" -> python, "AWS/GCP" ->
+aws, gcp). Each job is a binary skill vector, stored column-wise: per skill,
+a NumPy array of the job slots that ask for it, plus each job's vector
+norm. A user's vector holds the skills found in their bio, weighted by
+inverse document frequency so rare skills count for more. Scoring the whole
+catalogue is one scatter-add per user skill, followed by a top-k partition.
+
+Like job_search, each process keeps its own matrix: built from MongoDB in
+the background on first use (the dashboard shows no recommendations until
+it is ready), extended from JOBS_CHANGED events and rebuilt in the
+background after a bulk replace and every RECOMMEND_INDEX_TTL seconds
+(default 600). Results are cached per user
+for RECOMMEND_CACHE_TTL seconds (default 300), or until the user's bio
+changes, they apply for a job or jobs are added.
+"""
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+
+import events
+from job_search import tokenize
+
+
+RECOMMEND_INDEX_TTL = int(os.environ.get('RECOMMEND_INDEX_TTL', 600))
+RECOMMEND_CACHE_TTL = int(os.environ.get('RECOMMEND_CACHE_TTL', 300))
+RECOMMEND_CACHE_SIZE = int(os.environ.get('RECOMMEND_CACHE_SIZE', 10000))
+TOP_K = 5
+
+_MAX_SKILL_WORDS = 3
+_SPLIT = re.compile(r'[/,;|()]|\band\b|\bor\b', re.IGNORECASE)
+
+CARD_PROJECTION = {'title': 1, 'company': 1, 'location': 1, 'salary': 1}
+
+
+def extract_skills(requirement):
+    """Canonical skill names in one requirement, without version numbers"""
+    skills = []
+    for part in _SPLIT.split(requirement or ''):
+        words = [t for t in tokenize(part) if not t[0].isdigit()]
+        if 0 < len(words) <= _MAX_SKILL_WORDS:
+            skills.append(' '.join(words))
+    return skills
+
+
+def job_skills(job):
+    skills = []
+    for requirement in job.get('requirements') or ():
+        for skill in extract_skills(str(requirement)):
+            if skill not in skills:
+                skills.append(skill)
+    return skills
+
+
+def _grow(array, capacity):
+    grown = np.zeros(capacity, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class SkillMatrix:
+    """Jobs x skills binary matrix held as per-skill postings"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._size = 0
+        self._job_ids = []              # slot -> job_id
+        self._slots = {}                # job_id -> slot
+        self._job_skills = []           # slot -> skill columns
+        self._alive = np.zeros(0, dtype=bool)
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._columns = {}              # skill -> column
+        self._skills = []               # column -> skill
+        self._postings = defaultdict(list)  # column -> slots
+        self._frozen = {}               # column -> slots as an array, dropped on change
+        self._df = []                   # column -> live jobs with the skill
+        self.built_at = 0.0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _column(self, skill):
+        column = self._columns.get(skill)
+        if column is None:
+            column = self._columns[skill] = len(self._skills)
+            self._skills.append(skill)
+            self._df.append(0)
+        return column
+
+    def add(self, job):
+        """Add a job's skill vector, replacing any previous version of it"""
+        skills = job_skills(job)
+        with self._lock:
+            self.remove(job['_id'])
+            if self._size >= len(self._alive):
+                capacity = max(1024, len(self._alive) * 2)
+                self._alive = _grow(self._alive, capacity)
+                self._norms = _grow(self._norms, capacity)
+            slot = self._size
+            self._size += 1
+            columns = [self._column(skill) for skill in skills]
+            self._job_ids.append(job['_id'])
+            self._slots[job['_id']] = slot
+            self._job_skills.append(columns)
+            self._alive[slot] = True
+            self._norms[slot] = math.sqrt(len(columns)) if columns else 1.0
+            for column in columns:
+                self._postings[column].append(slot)
+                self._frozen.pop(column, None)
+                self._df[column] += 1
+
+    def remove(self, job_id):
+        with self._lock:
+            slot = self._slots.pop(job_id, None)
+            if slot is not None:
+                self._alive[slot] = False
+                for column in self._job_skills[slot]:
+                    self._df[column] -= 1
+
+    def _frozen_postings(self, column):
+        frozen = self._frozen.get(column)
+        if frozen is None:
+            frozen = self._frozen[column] = np.array(self._postings[column], dtype=np.int32)
+        return frozen
+
+    def user_vector(self, text):
+        """{column: idf weight} for the known skills mentioned in `text`"""
+        words = tokenize(text)
+        vector = {}
+        with self._lock:
+            live = max(len(self._slots), 1)
+            for n in range(1, _MAX_SKILL_WORDS + 1):
+                for i in range(len(words) - n + 1):
+                    column = self._columns.get(' '.join(words[i:i + n]))
+                    if column is not None and self._df[column] > 0:
+                        vector[column] = math.log((live + 1) / (self._df[column] + 1)) + 1
+        return vector
+
+    def top_k(self, vector, k=TOP_K, exclude=()):
+        """Best (cosine score, job_id, matched skills) for a user vector, best first"""
+        if not vector:
+            return []
+        with self._lock:
+            size = self._size
+            scores = np.zeros(size, dtype=np.float32)
+            for column, weight in vector.items():
+                scores[self._frozen_postings(column)] += weight
+            scores /= self._norms[:size]
+            scores[~self._alive[:size]] = 0
+            for job_id in exclude:
+                slot = self._slots.get(job_id)
+                if slot is not None:
+                    scores[slot] = 0
+
+            candidates = np.flatnonzero(scores)
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(scores[candidates], -k)[-k:]]
+            candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+
+            user_norm = math.sqrt(sum(w * w for w in vector.values()))
+            return [(float(scores[slot]) / user_norm, self._job_ids[slot],
+                     [self._skills[c] for c in self._job_skills[slot] if c in vector])
+                    for slot in candidates]
+
+
+_matrix = None
+_matrix_lock = threading.Lock()
+_rebuilding = False
+_stale = False      # a replace made the matrix out of date; rebuild without waiting for the TTL
+# bumped by JOBS_CHANGED events that replace jobs; a matrix built from a scan
+# that started before the latest bump may predate the replace and is discarded
+_generation = 0
+_added_during_rebuild = []     # replayed into the rebuilt matrix, which may have missed them
+
+_cache_lock = threading.Lock()
+_cache = OrderedDict()      # user_id -> (bio, recommendations, expires_at)
+
+
+def build_matrix(jobs_col):
+    matrix = SkillMatrix()
+    for job in jobs_col.find({}, {'requirements': 1}).batch_size(1000):
+        matrix.add(job)
+    matrix.built_at = time.monotonic()
+    return matrix
+
+
+def _rebuild_in_background(jobs_col):
+    """Start a build; the caller holds _matrix_lock"""
+    global _rebuilding
+    generation = _generation
+    del _added_during_rebuild[:]
+
+    def run():
+        global _matrix, _rebuilding, _stale
+        try:
+            matrix = build_matrix(jobs_col)
+            with _matrix_lock:
+                if _generation == generation:
+                    for job in _added_during_rebuild:
+                        matrix.add(job)
+                    _matrix = matrix
+                    _stale = False
+        finally:
+            with _matrix_lock:
+                _rebuilding = False
+                del _added_during_rebuild[:]
+
+    _rebuilding = True
+    threading.Thread(target=run, name='recommend-rebuild', daemon=True).start()
+
+
+def get_matrix(jobs_col):
+    """The process-wide skill matrix, or None while the first one is being built
+
+    Builds and refreshes (after a replace or every RECOMMEND_INDEX_TTL
+    seconds) happen in the background; the current matrix keeps serving.
+    """
+    matrix = _matrix
+    if not _rebuilding and (matrix is None or _stale
+                            or time.monotonic() - matrix.built_at > RECOMMEND_INDEX_TTL):
+        with _matrix_lock:
+            if not _rebuilding:
+                _rebuild_in_background(jobs_col)
+    return matrix
+
+
+def recommendations(jobs_col, applications_col, user, k=TOP_K):
+    """Up to `k` job cards for `user` (a CachedUser), each with 'score' and 'matched_skills'
+
+    Jobs the user already applied for are left out. None until this
+    process has built its skill matrix.
+    """
+    bio = user.bio or ''
+    key = str(user._id)
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == bio and cached[2] > now:
+            _cache.move_to_end(key)
+            return cached[1]
+
+    matrix = get_matrix(jobs_col)
+    if matrix is None:
+        return None
+    vector = matrix.user_vector(bio)
+    rows = []
+    if vector:
+        applied = applications_col.distinct('job_id', {'user_id': user._id})
+        hits = matrix.top_k(vector, k, exclude=applied)
+        cards = {job['_id']: job for job in
+                 jobs_col.find({'_id': {'$in': [job_id for _, job_id, _ in hits]}}, CARD_PROJECTION)}
+        for score, job_id, matched in hits:
+            job = cards.get(job_id)
+            if job is not None:
+                job['score'] = round(score * 100)
+                job['matched_skills'] = matched
+                rows.append(job)
+
+    with _cache_lock:
+        _cache[key] = (bio, rows, now + RECOMMEND_CACHE_TTL)
+        _cache.move_to_end(key)
+        while len(_cache) > RECOMMEND_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return rows
+
+
+def invalidate(user_id=None):
+    """Forget cached recommendations for one user, or for everyone"""
+    with _cache_lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(str(user_id), None)
+
+
+def _on_jobs_changed(jobs=None, replaced=False, **_):
+    global _generation, _stale
+    invalidate()
+    with _matrix_lock:
+        if replaced or jobs is None:
+            _generation += 1
+            _stale = True
+            return
+        if _matrix is not None:
+            for job in jobs:
+                _matrix.add(job)
+        if _rebuilding:
+            _added_during_rebuild.extend(jobs)
+
+
+def _on_applications_changed(applications=None, **_):
+    for application in applications or ():
+        invalidate(application['user_id'])
+
+
+events.subscribe(events.JOBS_CHANGED, _on_jobs_changed)
+events.subscribe(events.APPLICATIONS_CHANGED, _on_applications_changed)
@@ -0,0 +1,86 @@
+"""Cached current-user records
+
+The logged-in user is loaded at most once per request (kept on flask.g) and
+at most once per USER_CACHE_TTL seconds per process (default 60). Records
+hold only the fields templates render. Call invalidate() after changing a
+user; other processes pick the change up when their entry expires.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from bson.objectid import ObjectId
+from flask import g, has_app_context, session
+
+
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 10000))
+
+
+class CachedUser:
+    __slots__ = ('_id', 'full_name', 'email', 'phone', 'location', 'bio', 'profile_image',
+                 'created_at', 'expires_at')
+
+    FIELDS = ('full_name', 'email', 'phone', 'location', 'bio', 'profile_image', 'created_at')
+
+    def __init__(self, doc, expires_at):
+        self._id = doc['_id']
+        for field in self.FIELDS:
+            setattr(self, field, doc.get(field))
+        self.expires_at = expires_at
+
+
+_PROJECTION = dict.fromkeys(CachedUser.FIELDS, 1)
+
+_lock = threading.Lock()
+_users = OrderedDict()
+
+
+def current_user_id():
+    """The logged-in user's ObjectId, parsed once per request; None when logged out"""
+    if 'user_id' not in session:
+        return None
+    if 'user_oid' not in g:
+        g.user_oid = ObjectId(session['user_id'])
+    return g.user_oid
+
+
+def get_user(users_col, user_id):
+    """Return the CachedUser for `user_id` (an ObjectId), or None if it does not exist"""
+    key = str(user_id)
+    now = time.monotonic()
+    with _lock:
+        user = _users.get(key)
+        if user is not None and user.expires_at > now:
+            _users.move_to_end(key)
+            return user
+
+    doc = users_col.find_one({'_id': user_id}, _PROJECTION)
+    if doc is None:
+        invalidate(user_id)
+        return None
+    user = CachedUser(doc, now + USER_CACHE_TTL)
+    with _lock:
+        _users[key] = user
+        _users.move_to_end(key)
+        while len(_users) > USER_CACHE_SIZE:
+            _users.popitem(last=False)
+    return user
+
+
+def current_user(users_col):
+    """The logged-in user's CachedUser, loaded at most once per request"""
+    user_id = current_user_id()
+    if user_id is None:
+        return None
+    if 'current_user' not in g:
+        g.current_user = get_user(users_col, user_id)
+    return g.current_user
+
+
+def invalidate(user_id):
+    with _lock:
+        _users.pop(str(user_id), None)
+    if has_app_context():
+        g.pop('current_user', None)